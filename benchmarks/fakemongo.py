@@ -0,0 +1,182 @@
+from collections import Counter
+
+operations = Counter()
+
+def matches(document, query):
+    for key, condition in query.items():
+        value = document.get(key)
+        if isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            for op, argument in condition.items():
+                if op == '$gte' and not (value is not None and value >= argument):
+                    return False
+                if op == '$gt' and not (value is not None and value > argument):
+                    return False
+                if op == '$ne' and (value == argument or (isinstance(value, list) and argument in value)):
+                    return False
+                if op == '$exists' and (key in document) != argument:
+                    return False
+                if op == '$in' and value not in argument:
+                    return False
+        elif value != condition and not (isinstance(value, list) and condition in value):
+            return False
+    return True
+
+def apply(document, update, inserting):
+    for op, fields in update.items():
+        for key, argument in fields.items():
+            if op == '$inc':
+                document[key] = document.get(key, 0) + argument
+            elif op == '$max':
+                if key not in document or argument > document[key]:
+                    document[key] = argument
+            elif op == '$set':
+                document[key] = argument
+            elif op == '$setOnInsert':
+                if inserting:
+                    document[key] = argument
+            elif op == '$push':
+                values = document.setdefault(key, [])
+                if isinstance(argument, dict) and '$each' in argument:
+                    values.extend(argument['$each'])
+                    if '$slice' in argument:
+                        document[key] = values[argument['$slice']:]
+                else:
+                    values.append(argument)
+
+def project(document, projection):
+    if document is None or not projection:
+        return dict(document) if document else document
+    return {key: value for key, value in document.items() if key == '_id' or key in projection}
+
+def group(documents, spec):
+    groups = {}
+    for document in documents:
+        key = document.get(spec['_id'].lstrip('$')) if spec['_id'] else None
+        result = groups.setdefault(key, {'_id': key})
+        for name, accumulator in spec.items():
+            if name == '_id':
+                continue
+            op, field = next(iter(accumulator.items()))
+            value = document.get(field.lstrip('$'), 0)
+            if op == '$sum':
+                result[name] = result.get(name, 0) + value
+            elif op == '$max':
+                result[name] = max(result.get(name, value), value)
+    return list(groups.values())
+
+class Result:
+    def __init__(self, upserted_ids=None):
+        self.upserted_ids = upserted_ids or {}
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, field, direction=1):
+        self.documents.sort(key=lambda document: document.get(field, 0), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.documents
+
+class Collection:
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+
+    def count(self, operation):
+        operations[f"{self.name}.{operation}"] += 1
+
+    def candidates(self, query):
+        if '_id' in query and not isinstance(query['_id'], dict):
+            document = self.documents.get(query['_id'])
+            return [document] if document is not None else []
+        return list(self.documents.values())
+
+    def upsert(self, query, update, upsert):
+        for document in self.candidates(query):
+            if matches(document, query):
+                apply(document, update, False)
+                return document, None
+        if not upsert:
+            return None, None
+
+        document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+        apply(document, update, True)
+        if document['_id'] in self.documents:
+            raise KeyError(f"duplicate key {document['_id']}")
+        self.documents[document['_id']] = document
+        return document, document['_id']
+
+    async def find_one(self, query, projection=None):
+        self.count("find_one")
+        document = next((document for document in self.candidates(query) if matches(document, query)), None)
+        return project(document, projection)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None):
+        self.count("find_one_and_update")
+        document, _ = self.upsert(query, update, upsert)
+        return project(document, projection)
+
+    async def update_one(self, query, update, upsert=False):
+        self.count("update_one")
+        self.upsert(query, update, upsert)
+        return Result()
+
+    async def insert_one(self, document):
+        self.count("insert_one")
+        self.documents[document['_id']] = dict(document)
+        return Result()
+
+    async def bulk_write(self, requests, ordered=True):
+        self.count("bulk_write")
+        upserted_ids = {}
+        for index, request in enumerate(requests):
+            _, upserted_id = self.upsert(request._filter, request._doc, request._upsert)
+            if upserted_id is not None:
+                upserted_ids[index] = upserted_id
+        return Result(upserted_ids)
+
+    async def count_documents(self, query):
+        self.count("count_documents")
+        return sum(1 for document in self.documents.values() if matches(document, query))
+
+    def find(self, query, projection=None):
+        self.count("find")
+        return Cursor([project(document, projection) for document in self.documents.values() if matches(document, query)])
+
+    async def aggregate(self, pipeline):
+        # $match, $group with $sum/$max, $sort and $limit, enough for the counter seed and rollup boards
+        self.count("aggregate")
+        documents = list(self.documents.values())
+        for stage in pipeline:
+            if "$match" in stage:
+                documents = [document for document in documents if matches(document, stage["$match"])]
+            elif "$group" in stage:
+                documents = group(documents, stage["$group"])
+            elif "$sort" in stage:
+                for field, direction in reversed(list(stage["$sort"].items())):
+                    documents.sort(key=lambda document: document.get(field, 0), reverse=direction < 0)
+            elif "$limit" in stage:
+                documents = documents[:stage["$limit"]]
+        return Cursor(documents)
+
+    async def create_index(self, keys):
+        self.count("create_index")
+
+class Database:
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = Collection(name)
+        return self.collections[name]
+
+class FakeMongo:
+    def __init__(self):
+        self.captcha = Database()
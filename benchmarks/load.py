@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+workdir = tempfile.mkdtemp(prefix="captcha-load-")
+os.environ.setdefault("GAME_SPOOL_PATH", os.path.join(workdir, "pending_games.jsonl"))
+os.environ.setdefault("SESSION_JOURNAL_PATH", os.path.join(workdir, "sessions.jsonl"))
+
+import database
+import main
+from benchmarks.fakemongo import FakeMongo, operations
+
+message_ids = itertools.count(1)
+latencies = defaultdict(list)
+
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.name = f"player{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.avatar = FakeAvatar()
+        self.bot = bot
+        self.premium_since = None
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.members = []
+
+    def get_member(self, player_id):
+        return FakeUser(player_id)
+
+class FakeMessage:
+    def __init__(self, channel, author=None, content="", embed=None):
+        self.id = next(message_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = [embed] if embed else []
+
+    async def edit(self, embed=None):
+        await asyncio.sleep(self.channel.latency)
+
+class FakeChannel:
+    def __init__(self, channel_id, guild, latency):
+        self.id = channel_id
+        self.guild = guild
+        self.latency = latency
+
+    async def send(self, content=None, embed=None, embeds=None, file=None):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self, content=content, embed=embed)
+
+class FakeContext:
+    def __init__(self, author, channel):
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.message = FakeMessage(channel, author)
+
+    async def send(self, content=None, embed=None, embeds=None, file=None):
+        return await self.channel.send(content, embed=embed, embeds=embeds, file=file)
+
+async def timed(name, handler):
+    start = time.perf_counter()
+    await handler
+    latencies[name].append(time.perf_counter() - start)
+
+async def ignore_commands(message):
+    # simulated answers never carry commands; commands are invoked directly below
+    return
+
+async def simulate_player(player_id, channel, args, deadline):
+    player = FakeUser(player_id)
+    ctx = FakeContext(player, channel)
+
+    while time.monotonic() < deadline:
+        session = main.sessions.get(player_id)
+        if session is None:
+            roll = random.random()
+            if roll < 0.2:
+                await timed("statistics", main.statistics(ctx))
+            elif roll < 0.25:
+                await timed("leaderboard", main.stats(ctx))
+            elif roll < 0.3:
+                await timed("leaderboard", main.stats(ctx, random.choice(("daily", "weekly")), "server"))
+            elif roll < 0.35:
+                await timed("buy", main.buy(ctx, 1))
+            await timed("play", main.play(ctx))
+            continue
+
+        await asyncio.sleep(random.uniform(*args.think))
+        session = main.sessions.get(player_id)
+        if session is None:
+            continue
+
+        roll = random.random()
+        if roll < args.skip_rate:
+            await timed("skip", main.skip(ctx))
+        elif roll < args.skip_rate + args.idle_rate:
+            # let the round time out
+            await asyncio.sleep(11)
+        else:
+            content = session.answer if random.random() < args.solve_rate else "WRONG"
+            await timed("answer", main.on_message(FakeMessage(channel, player, content)))
+
+async def buy_race(channel, buyers, coins):
+    player_id = 999999999
+    await database.players.update_one({'_id': player_id}, {'$set': {'coins': coins, 'skips': 0}}, upsert=True)
+    ctx = FakeContext(FakeUser(player_id), channel)
+    await asyncio.gather(*[main.buy(ctx, 1) for _ in range(buyers)])
+    return await database.get_player(player_id)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0
+
+async def run(args):
+    database.connect(FakeMongo())
+    main.guild = FakeGuild(1201163257461866596)
+    main.bot._connection.user = FakeUser(1200756820403306586, bot=True)
+    main.bot.process_commands = ignore_commands
+
+    guild = FakeGuild(1)
+    channels = [FakeChannel(channel_id, guild, args.latency) for channel_id in range(1, args.channels + 1)]
+    for player_id in range(1, args.players + 1):
+        await database.players.update_one({'_id': player_id}, {'$set': {'coins': 100000, 'skips': 100}}, upsert=True)
+
+    main.captcha_pool.start()
+    main.round_timer.start()
+    main.loop_watchdog.start()
+    await database.seed_games_count()
+    main.game_writer.start()
+
+    warmup = time.monotonic() + 30
+    while len(main.captcha_pool.captchas) < main.captcha_pool.size and time.monotonic() < warmup:
+        await asyncio.sleep(0.1)
+    main.captcha_pool.hits = main.captcha_pool.misses = 0
+    operations.clear()
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*[
+        simulate_player(player_id, channels[player_id % len(channels)], args, deadline)
+        for player_id in range(1, args.players + 1)
+    ])
+    # let the last rounds expire and flush every finished game
+    await asyncio.sleep(11)
+    await main.game_writer.stop()
+    elapsed = time.monotonic() - start
+
+    games = sum(main.games_lost.values.values()) + sum(main.games_expired.values.values())
+    calls = sum(len(values) for values in latencies.values())
+    print(f"{args.players} players, {args.duration}s, solve rate {args.solve_rate}")
+    print(f"throughput: {calls/elapsed:.1f} commands/sec, {games} games finished")
+    for name, values in sorted(latencies.items()):
+        print(f"  {name:12} n={len(values):6} p50={percentile(values, 0.5)*1000:8.1f}ms p99={percentile(values, 0.99)*1000:8.1f}ms")
+
+    p50, p99 = main.loop_watchdog.percentiles()
+    print(f"loop lag: p50={p50*1000:.1f}ms p99={p99*1000:.1f}ms")
+    print(f"captcha pool: {main.captcha_pool.hits} hits, {main.captcha_pool.misses} misses")
+    print(f"db operations per game: {sum(operations.values())/max(games, 1):.2f}")
+    for operation, count in operations.most_common():
+        print(f"  {operation:40} {count}")
+
+    player = await buy_race(channels[0], args.buyers, 5000)
+    print(f"{args.buyers} concurrent ;buy 1 with 5000 coins: coins={player['coins']} skips={player['skips']}")
+    main.captcha_pool.renderer.stop()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Drive the bot's handlers with simulated players")
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--solve-rate", type=float, default=0.9)
+    parser.add_argument("--skip-rate", type=float, default=0.05)
+    parser.add_argument("--idle-rate", type=float, default=0.02)
+    parser.add_argument("--think", type=float, nargs=2, default=(0.5, 3))
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Discord REST latency in seconds")
+    parser.add_argument("--buyers", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,21 @@
+import time
+from captcha.image import ImageCaptcha
+from captchas import random_answer, render_captcha
+
+def per_call(random_string):
+    return ImageCaptcha().generate(random_string).getvalue()
+
+def run(name, render, count=200):
+    answers = [random_answer() for _ in range(count)]
+    render(answers[0])
+
+    start = time.perf_counter()
+    for answer in answers:
+        render(answer)
+    elapsed = time.perf_counter() - start
+
+    print(f"{name}: {count/elapsed:.1f} captchas/sec")
+
+if __name__ == '__main__':
+    run("ImageCaptcha() per call", per_call)
+    run("shared GlyphCaptcha", render_captcha)
@@ -1,20 +1,89 @@
+import os
 import random
+import secrets
 import string
-from io import BytesIO
 from captcha.image import ImageCaptcha
-from PIL import Image
-import os
+from PIL.Image import new as createImage, Resampling, Transform
+from PIL.ImageDraw import Draw
 
-def generate_captcha():
-    random_string = ''.join(random.choices(string.ascii_uppercase, k=6))
+class GlyphCaptcha(ImageCaptcha):
+    glyph_characters = string.ascii_uppercase
+
+    def __init__(self, width=160, height=60, fonts=None, font_sizes=None):
+        super().__init__(width, height, fonts, font_sizes)
+        self._glyphs = {}
+
+    @property
+    def glyphs(self):
+        if self._glyphs:
+            return self._glyphs
+
+        draw = Draw(createImage('RGB', (self._width, self._height)))
+        for index, font in enumerate(self.truefonts):
+            for c in self.glyph_characters:
+                _, _, w, h = draw.multiline_textbbox((1, 1), c, font=font)
+                alpha = createImage('L', (int(w), int(h)))
+                Draw(alpha).text((0, 0), c, font=font, fill=255)
+                alpha = alpha.crop(alpha.getbbox())
+                cover = alpha.point(lambda v: 255 if v else 0)
+                self._glyphs[(index, c)] = (w, h, alpha, cover)
+        return self._glyphs
+
+    def _draw_character(self, c, draw, color):
+        index = secrets.randbelow(len(self.truefonts))
+        glyph = self.glyphs.get((index, c))
+        if glyph is None:
+            return super()._draw_character(c, draw, color)
+        w, h, alpha, cover = glyph
 
-    captcha = ImageCaptcha()
-    data: BytesIO = captcha.generate(random_string)
+        # colour the cached glyph the same way Draw.text would on a transparent canvas
+        opacity = color[3] if len(color) == 4 else 255
+        im = createImage('RGBA', alpha.size)
+        im.paste(tuple(color[:3]) + (0,), (0, 0), cover)
+        im.putalpha(alpha.point([v * opacity // 255 for v in range(256)]))
 
-    image = Image.open(data)
-    image.save(f'/usr/bot/captcha-bot/captchas/{random_string}.png')
+        # rotate
+        im = im.rotate(
+            self.character_rotate[0] + (secrets.randbits(32) / (2**32)) * (self.character_rotate[1] - self.character_rotate[0]),
+            Resampling.BILINEAR,
+            expand=True,
+        )
 
-    return random_string
+        # warp
+        dx2 = w * (secrets.randbits(32) / (2**32)) * (self.character_warp_dx[1] - self.character_warp_dx[0]) + self.character_warp_dx[0]
+        dy2 = h * (secrets.randbits(32) / (2**32)) * (self.character_warp_dy[1] - self.character_warp_dy[0]) + self.character_warp_dy[0]
+        x1 = int(secrets.randbits(32) / (2**32) * (dx2 - (-dx2)) + (-dx2))
+        y1 = int(secrets.randbits(32) / (2**32) * (dy2 - (-dy2)) + (-dy2))
+        x2 = int(secrets.randbits(32) / (2**32) * (dx2 - (-dx2)) + (-dx2))
+        y2 = int(secrets.randbits(32) / (2**32) * (dy2 - (-dy2)) + (-dy2))
+        w2 = w + abs(x1) + abs(x2)
+        h2 = h + abs(y1) + abs(y2)
+        data = (
+            x1, y1,
+            -x1, h2 - y2,
+            w2 + x2, h2 + y2,
+            w2 - x2, -y1,
+        )
+        im = im.resize((int(w2), int(h2)))
+        im = im.transform((int(w), int(h)), Transform.QUAD, data)
+        return im
+
+captcha_fonts = os.environ.get("CAPTCHA_FONTS")
+
+captcha = GlyphCaptcha(
+    width=int(os.environ.get("CAPTCHA_WIDTH", 160)),
+    height=int(os.environ.get("CAPTCHA_HEIGHT", 60)),
+    fonts=captcha_fonts.split(",") if captcha_fonts else None
+)
+
+def random_answer():
+    return ''.join(random.choices(string.ascii_uppercase, k=6))
+
+def render_captcha(random_string):
+    return captcha.generate(random_string).getvalue()
+
+def generate_captcha():
+    random_string = random_answer()
+    image = render_captcha(random_string)
 
-def delete_captcha(string):
-    os.remove(f'/usr/bot/captcha-bot/captchas/{string}.png')
+    return random_string, image
@@ -0,0 +1,57 @@
+import fcntl
+import json
+import time
+
+def claim(leases, name, owner, ttl):
+    holder, expires = leases.get(name, (None, 0))
+    now = time.time()
+    if holder not in (None, owner) and expires >= now:
+        return False
+    leases[name] = [owner, now + ttl]
+    return True
+
+def release(leases, name, owner):
+    holder, expires = leases.get(name, (None, 0))
+    if holder != owner:
+        return False
+    del leases[name]
+    return True
+
+class MemoryCoordinator:
+    def __init__(self):
+        self.leases = {}
+
+    def acquire(self, name, owner, ttl):
+        return claim(self.leases, name, owner, ttl)
+
+    def release(self, name, owner):
+        return release(self.leases, name, owner)
+
+class FileCoordinator:
+    def __init__(self, path):
+        self.path = path
+
+    def acquire(self, name, owner, ttl):
+        return self.update(claim, name, owner, ttl)
+
+    def release(self, name, owner):
+        return self.update(release, name, owner)
+
+    def update(self, change, *args):
+        with open(self.path, 'a+') as coordinator:
+            fcntl.flock(coordinator, fcntl.LOCK_EX)
+            coordinator.seek(0)
+            data = coordinator.read()
+            leases = json.loads(data) if data else {}
+
+            if not change(leases, *args):
+                return False
+
+            # player leases come and go, drop the ones a crashed cluster left behind
+            now = time.time()
+            leases = {name: lease for name, lease in leases.items() if lease[1] >= now}
+
+            coordinator.seek(0)
+            coordinator.truncate()
+            json.dump(leases, coordinator)
+            return True
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+from metrics import mongo_query_seconds, timed
+import os
+from pymongo import AsyncMongoClient, UpdateOne
+
+max_pool_size = int(os.environ.get("DATABASE_MAX_POOL_SIZE", 50))
+min_pool_size = int(os.environ.get("DATABASE_MIN_POOL_SIZE", 5))
+timeout_ms = int(os.environ.get("DATABASE_TIMEOUT_MS", 5000))
+recent_games_size = 100
+
+# every access pattern's index, created idempotently at startup
+indexes = {
+    'players': [
+        [('total_score', -1)],
+        [('high_score', -1)],
+        [('total_games', -1)]
+    ],
+    'games': [
+        [('player_id', 1), ('datetime', 1)],
+        [('guild_id', 1), ('datetime', -1)],
+        [('datetime', -1)]
+    ],
+    'rollups': [
+        [('guild_id', 1), ('day', 1)]
+    ]
+}
+
+mongo = None
+players = None
+games = None
+counters = None
+rollups = None
+
+def create_client(database_url):
+    return AsyncMongoClient(
+        database_url,
+        maxPoolSize=max_pool_size,
+        minPoolSize=min_pool_size,
+        serverSelectionTimeoutMS=timeout_ms,
+        connectTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
+    )
+
+def connect(client):
+    global mongo, players, games, counters, rollups
+    mongo = client
+    db = mongo.captcha
+    players = db["players"]
+    games = db["games"]
+    counters = db["counters"]
+    rollups = db["rollups"]
+
+@timed(mongo_query_seconds.labels('create_indexes'))
+async def create_indexes():
+    db = mongo.captcha
+    for collection, keys in indexes.items():
+        for key in keys:
+            await db[collection].create_index(key)
+
+@timed(mongo_query_seconds.labels('get_player'))
+async def get_player(player_id, projection=None):
+    return await players.find_one({'_id': player_id}, projection)
+
+def day_key(moment):
+    return moment.strftime('%Y-%m-%d')
+
+def applied_once(key, game_id, update, on_insert=None):
+    # the document remembers the game ids it has applied, so a retried batch can't apply a game twice
+    return [
+        UpdateOne({'_id': key}, {'$setOnInsert': {**(on_insert or {}), 'recent_games': []}}, upsert=True),
+        UpdateOne(
+            {'_id': key, 'recent_games': {'$ne': game_id}},
+            {**update, '$push': {'recent_games': {'$each': [game_id], '$slice': -recent_games_size}}}
+        )
+    ]
+
+def rollup_buckets(guild_id, day):
+    # one bucket per (guild, day) and (guild, all time), plus a global one per day;
+    # global all time is already the totals on the player document
+    buckets = [(None, day)]
+    if guild_id is not None:
+        buckets += [(guild_id, day), (guild_id, None)]
+    return buckets
+
+def rollup_key(guild_id, day, player_id):
+    return f"{guild_id}:{day or 'all'}:{player_id}"
+
+def rollup_requests(record):
+    requests = []
+    for bucket_guild, bucket_day in rollup_buckets(record['guild_id'], day_key(record['datetime'])):
+        requests += applied_once(
+            rollup_key(bucket_guild, bucket_day, record['player_id']),
+            record['_id'],
+            {
+                '$inc': {'total_games': 1, 'total_score': record['score']},
+                '$max': {'high_score': record['score']}
+            },
+            {'guild_id': bucket_guild, 'day': bucket_day, 'player_id': record['player_id']}
+        )
+    return requests
+
+def write_requests(records, writer=0):
+    player_requests = []
+    rollup_updates = []
+    game_requests = []
+    for record in records:
+        game_id = record['_id']
+        game = {key: record[key] for key in ('player_id', 'datetime', 'guild_id', 'score', 'coins')}
+
+        player_requests += applied_once(record['player_id'], game_id, {
+            '$inc': {'total_games': 1, 'total_score': record['score'], 'coins': record['coins']},
+            '$max': {'high_score': record['score'], 'last_played': record['datetime']}
+        })
+        rollup_updates += rollup_requests(record)
+        game_requests.append(UpdateOne({'_id': game_id}, {'$setOnInsert': game}, upsert=True))
+
+    # each writer has its own counter shard; a writer retries a failed batch before anything newer,
+    # so the last recent_games_size ids on its shard always cover the retry
+    counter_requests = []
+    for record in records:
+        counter_requests += applied_once(f"captchas:{writer}", record['_id'], {'$inc': {'total': record['score']}}, {'counter': 'captchas'})
+
+    return {'players': player_requests, 'rollups': rollup_updates, 'counters': counter_requests, 'games': game_requests}
+
+@timed(mongo_query_seconds.labels('write_games'))
+async def write_games(records, writer=0):
+    requests = write_requests(records, writer)
+    await players.bulk_write(requests['players'], ordered=True)
+    await rollups.bulk_write(requests['rollups'], ordered=True)
+    await counters.bulk_write(requests['counters'], ordered=True)
+    await games.bulk_write(requests['games'], ordered=False)
+
+    player_ids = list({record['player_id'] for record in records})
+    return await players.find({'_id': {'$in': player_ids}}, {'total_games': 1, 'total_score': 1, 'high_score': 1}).to_list()
+
+@timed(mongo_query_seconds.labels('seed_games_count'))
+async def seed_games_count():
+    if await counters.find_one({'_id': 'captchas'}) is not None:
+        await counters.update_one({'_id': 'captchas'}, {'$set': {'counter': 'captchas'}})
+        return
+
+    games_query = [
+        {
+            "$group": {
+                "_id": None,
+                "total_score": {"$sum": "$total_score"}
+            }
+        }
+    ]
+
+    result = await (await players.aggregate(games_query)).to_list()
+    total = result[0]["total_score"] if result else 0
+    await counters.update_one({'_id': 'captchas'}, {'$setOnInsert': {'total': total, 'counter': 'captchas'}}, upsert=True)
+
+@timed(mongo_query_seconds.labels('get_games_count'))
+async def get_games_count():
+    # the seeded total plus every writer's shard
+    return sum(counter.get('total', 0) for counter in await counters.find({'counter': 'captchas'}, {'total': 1}).to_list())
+
+@timed(mongo_query_seconds.labels('get_top'))
+async def get_top(field, size):
+    top = players.find({field: {'$exists': True}}, {field: 1}).sort(field, -1).limit(size)
+    return [(player["_id"], player[field]) for player in await top.to_list()]
+
+@timed(mongo_query_seconds.labels('get_window_top'))
+async def get_window_top(field, size, guild_id=None, days=None):
+    if guild_id is None and days is None:
+        return await get_top(field, size)
+
+    if days is None:
+        day = None
+    else:
+        day = {'$gte': day_key(datetime.now() - timedelta(days=days - 1))}
+
+    top_query = [
+        {"$match": {'guild_id': guild_id, 'day': day}},
+        {
+            "$group": {
+                "_id": "$player_id",
+                "total_games": {"$sum": "$total_games"},
+                "total_score": {"$sum": "$total_score"},
+                "high_score": {"$max": "$high_score"}
+            }
+        },
+        {"$sort": {field: -1}},
+        {"$limit": size}
+    ]
+
+    return [(player["_id"], player[field]) for player in await (await rollups.aggregate(top_query)).to_list()]
+
+@timed(mongo_query_seconds.labels('get_rank'))
+async def get_rank(field, value):
+    if value is None:
+        return None
+    return await players.count_documents({field: {'$gt': value}}) + 1
+
+@timed(mongo_query_seconds.labels('get_skips'))
+async def get_skips(player_id):
+    player_object = await players.find_one({"_id": player_id}, {"skips": 1})
+
+    if player_object is None:
+        return None
+    else:
+        return player_object.get("skips")
@@ -0,0 +1,17 @@
+class MessageFilter:
+    def __init__(self, sessions, prefix, vote_channel_id):
+        self.sessions = sessions
+        self.prefix = prefix
+        self.vote_channel_id = vote_channel_id
+        self.processed = 0
+        self.dropped = 0
+
+    def accept(self, message):
+        if (message.content.startswith(self.prefix)
+                or message.channel.id == self.vote_channel_id
+                or message.author.id in self.sessions.playing_in(message.channel.id)):
+            self.processed += 1
+            return True
+
+        self.dropped += 1
+        return False
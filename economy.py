@@ -0,0 +1,32 @@
+import database
+from metrics import mongo_query_seconds, timed
+from pymongo import ReturnDocument
+
+skip_price = 1000
+
+@timed(mongo_query_seconds.labels('buy_skips'))
+async def buy_skips(player_id, quantity):
+    return await database.players.find_one_and_update(
+        {'_id': player_id, 'coins': {'$gte': quantity * skip_price}},
+        {'$inc': {'coins': -quantity * skip_price, 'skips': quantity}},
+        projection={'coins': 1, 'skips': 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+@timed(mongo_query_seconds.labels('use_skip'))
+async def use_skip(player_id):
+    return await database.players.find_one_and_update(
+        {'_id': player_id, 'skips': {'$gt': 0}},
+        {'$inc': {'skips': -1}},
+        projection={'skips': 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+@timed(mongo_query_seconds.labels('reward_vote'))
+async def reward_vote(player_id, skips):
+    return await database.players.find_one_and_update(
+        {'_id': player_id},
+        {'$inc': {'skips': skips}},
+        projection={'skips': 1},
+        return_document=ReturnDocument.AFTER
+    )
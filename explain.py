@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+import os
+import sys
+import database
+
+database_url = os.environ.get("DATABASE_URL")
+
+# the shape of every query statistics, update_leaderboards (including windowed boards) and save_game send
+queries = {
+    'statistics': [
+        {'find': 'players', 'filter': {'_id': 0}, 'limit': 1},
+        {'count': 'players', 'query': {'total_score': {'$gt': 0}}},
+        {'count': 'players', 'query': {'high_score': {'$gt': 0}}}
+    ],
+    'update_leaderboards': [
+        {'find': 'players', 'filter': {field: {'$exists': True}}, 'projection': {field: 1}, 'sort': {field: -1}, 'limit': 10}
+        for field in ('total_score', 'high_score', 'total_games')
+    ],
+    'window_leaderboards': [
+        {'aggregate': 'rollups', 'pipeline': [
+            {'$match': {'guild_id': guild_id, 'day': day}},
+            {'$group': {'_id': '$player_id', 'total_score': {'$sum': '$total_score'}}},
+            {'$sort': {'total_score': -1}},
+            {'$limit': 10}
+        ], 'cursor': {}}
+        for guild_id, day in ((0, None), (0, {'$gte': ''}), (None, {'$gte': ''}))
+    ],
+    # save_game only queues; these are the writes the game writer flushes, built by the same code
+    'save_game': [
+        {'update': collection, 'updates': [{'q': request._filter, 'u': request._doc, 'upsert': bool(request._upsert)}]}
+        for collection, requests in database.write_requests([
+            {'_id': '', 'player_id': 0, 'datetime': datetime.now(), 'guild_id': 0, 'score': 0, 'coins': 0}
+        ]).items()
+        for request in requests
+    ] + [
+        {'find': 'players', 'filter': {'_id': {'$in': [0]}}, 'projection': {'total_games': 1, 'total_score': 1, 'high_score': 1}}
+    ]
+}
+
+def stages(plan):
+    yield plan['stage']
+    for child in plan.get('inputStages', []) + [plan[key] for key in ('inputStage', 'queryPlan') if key in plan]:
+        yield from stages(child)
+
+async def explain(command):
+    result = await database.mongo.captcha.command('explain', command, verbosity='queryPlanner')
+    # pipelines that aren't pushed down entirely report their plan under the first stage's $cursor
+    planner = result.get('queryPlanner') or result['stages'][0]['$cursor']['queryPlanner']
+    return set(stages(planner['winningPlan']))
+
+async def main():
+    database.connect(database.create_client(database_url))
+    if '--create' in sys.argv:
+        await database.create_indexes()
+
+    scans = 0
+    for handler, commands in queries.items():
+        for command in commands:
+            plan = await explain(command)
+            collection = next(iter(command.values()))
+            flag = "COLLSCAN" if 'COLLSCAN' in plan else "ok"
+            scans += flag == "COLLSCAN"
+            print(f"{flag:8} {handler:20} {collection:10} {'/'.join(sorted(plan))}")
+
+    await database.mongo.close()
+    sys.exit(1 if scans else 0)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,41 @@
+import json
+import os
+
+final_states = ('expired', 'lost')
+
+class SessionJournal:
+    def __init__(self, path, max_lines=10000):
+        self.path = path
+        self.max_lines = max_lines
+        self.lines = 0
+
+    def snapshot(self, session):
+        return {slot: getattr(session, slot) for slot in session.__slots__}
+
+    def record(self, session):
+        with open(self.path, 'a') as journal:
+            journal.write(json.dumps(self.snapshot(session)) + "\n")
+        self.lines += 1
+
+    def replay(self):
+        if not os.path.exists(self.path):
+            return []
+
+        latest = {}
+        with open(self.path) as journal:
+            for line in journal:
+                try:
+                    snapshot = json.loads(line)
+                except ValueError:
+                    # a crash can leave the last line half written
+                    continue
+                latest[snapshot['player_id']] = snapshot
+        return [snapshot for snapshot in latest.values() if snapshot['state'] not in final_states]
+
+    def compact(self, sessions):
+        path = self.path + ".tmp"
+        with open(path, 'w') as journal:
+            for session in sessions:
+                journal.write(json.dumps(self.snapshot(session)) + "\n")
+        os.replace(path, self.path)
+        self.lines = len(sessions)
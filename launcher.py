@@ -0,0 +1,54 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+shard_count = int(os.environ.get("SHARD_COUNT", 1))
+cluster_count = int(os.environ.get("CLUSTER_COUNT", 1))
+coordinator_path = os.environ.get("COORDINATOR_PATH", "coordinator.json")
+restart_delay = float(os.environ.get("CLUSTER_RESTART_DELAY", 5))
+
+def cluster_env(cluster_id):
+    shard_ids = [shard_id for shard_id in range(shard_count) if shard_id % cluster_count == cluster_id]
+    env = dict(os.environ)
+    env["CLUSTER_ID"] = str(cluster_id)
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = ",".join(str(shard_id) for shard_id in shard_ids)
+    env["COORDINATOR_PATH"] = coordinator_path
+    spool_root, spool_ext = os.path.splitext(os.environ.get("GAME_SPOOL_PATH", "pending_games.jsonl"))
+    env["GAME_SPOOL_PATH"] = f"{spool_root}.{cluster_id}{spool_ext}"
+    journal_root, journal_ext = os.path.splitext(os.environ.get("SESSION_JOURNAL_PATH", "sessions.jsonl"))
+    env["SESSION_JOURNAL_PATH"] = f"{journal_root}.{cluster_id}{journal_ext}"
+    if "METRICS_PORT" in os.environ:
+        env["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + cluster_id)
+    env.setdefault("CAPTCHA_WORKERS", str(max(1, (os.cpu_count() or 1) // cluster_count)))
+    return env
+
+def start_cluster(cluster_id):
+    env = cluster_env(cluster_id)
+    print(f"Starting cluster {cluster_id} with shards {env['SHARD_IDS']}")
+    return subprocess.Popen([sys.executable, "main.py"], env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+def stop_clusters(clusters):
+    for process in clusters.values():
+        process.send_signal(signal.SIGINT)
+    for process in clusters.values():
+        process.wait()
+
+if __name__ == '__main__':
+    # a cluster without shards would connect to every shard and double-handle guilds
+    if cluster_count > shard_count:
+        sys.exit(f"CLUSTER_COUNT ({cluster_count}) cannot be greater than SHARD_COUNT ({shard_count})")
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    clusters = {cluster_id: start_cluster(cluster_id) for cluster_id in range(cluster_count)}
+    try:
+        while True:
+            time.sleep(restart_delay)
+            for cluster_id, process in clusters.items():
+                if process.poll() is not None:
+                    print(f"Cluster {cluster_id} exited with {process.returncode}, restarting")
+                    clusters[cluster_id] = start_cluster(cluster_id)
+    except KeyboardInterrupt:
+        stop_clusters(clusters)
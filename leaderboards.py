@@ -0,0 +1,130 @@
+import asyncio
+from collections import OrderedDict
+import discord
+import time
+
+# window name -> (days looked back, title label); None covers all time
+windows = {
+    'all': (None, 'All Time'),
+    'weekly': (7, 'This Week'),
+    'daily': (1, 'Today')
+}
+
+def parse_posts(value):
+    # entries are a window name, optionally ':server' for the home guild's board, e.g. 'all,weekly:server'
+    posts = []
+    for entry in value.split(","):
+        window, _, scope = entry.strip().partition(":")
+        if window not in windows or scope not in ("", "server"):
+            print(f"Ignoring unknown leaderboard window {entry!r}")
+            continue
+        posts.append((window, scope == "server"))
+    return posts
+
+class Leaderboard:
+    def __init__(self, field, size=10):
+        self.field = field
+        self.size = size
+        self.entries = {}
+        self.generation = 0
+
+    def seed(self, top):
+        entries = dict(top[:self.size])
+        if entries != self.entries:
+            self.entries = entries
+            self.generation += 1
+
+    def update(self, player_id, value):
+        # totals only ever grow, so a player outside the top can only get in by beating the lowest entry
+        if player_id in self.entries:
+            changed = self.entries[player_id] != value
+            self.entries[player_id] = value
+        elif len(self.entries) < self.size:
+            self.entries[player_id] = value
+            changed = True
+        else:
+            lowest = min(self.entries, key=self.entries.get)
+            changed = value > self.entries[lowest]
+            if changed:
+                del self.entries[lowest]
+                self.entries[player_id] = value
+
+        if changed:
+            self.generation += 1
+        return changed
+
+    def top(self):
+        return sorted(self.entries.items(), key=lambda entry: entry[1], reverse=True)
+
+class LeaderboardEmbeds:
+    boards = (
+        ('high_score', 'Leaderboard - High Score', ''),
+        ('total_score', 'Leaderboard - Total Score', ''),
+        ('total_games', 'Leaderboard - Games Played', ' games')
+    )
+
+    def __init__(self, leaderboards, footer, label=None):
+        self.leaderboards = leaderboards
+        self.footer = footer
+        self.label = label
+        self.key = None
+        self.embeds = None
+        self.renders = 0
+
+    def get(self, thumbnail_url):
+        key = (thumbnail_url,) + tuple(self.leaderboards[field].generation for field, _, _ in self.boards)
+        if key != self.key:
+            self.embeds = [self.render(field, title, unit, thumbnail_url) for field, title, unit in self.boards]
+            self.key = key
+            self.renders += 1
+        return self.embeds
+
+    def render(self, field, title, unit, thumbnail_url):
+        description = ""
+        for i, (player_id, value) in enumerate(self.leaderboards[field].top(), 1):
+            description += f"{i}. <@{player_id}> - {value}{unit}\n"
+
+        embed = discord.Embed(
+            title=f"{title} ({self.label})" if self.label else title,
+            description=description,
+            color=discord.Color.purple()
+        )
+        embed.set_thumbnail(url=thumbnail_url)
+        embed.set_footer(text=self.footer)
+        return embed
+
+class WindowLeaderboards:
+    def __init__(self, query, footer, ttl=60, maxsize=1000):
+        self.query = query
+        self.footer = footer
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.boards = OrderedDict()
+
+    async def get(self, guild_id, window, label, thumbnail_url):
+        key = (guild_id, window)
+        board = self.boards.get(key)
+        if board is None:
+            leaderboards = {field: Leaderboard(field) for field, _, _ in LeaderboardEmbeds.boards}
+            board = [0, LeaderboardEmbeds(leaderboards, self.footer, label), None]
+            self.boards[key] = board
+            if len(self.boards) > self.maxsize:
+                self.boards.popitem(last=False)
+        self.boards.move_to_end(key)
+
+        if time.monotonic() >= board[0]:
+            # a burst on an expired window shares one refresh instead of each caller querying
+            if board[2] is None:
+                board[2] = asyncio.create_task(self.refresh(board, guild_id, window))
+            await asyncio.shield(board[2])
+        return board[1].get(thumbnail_url)
+
+    async def refresh(self, board, guild_id, window):
+        # rollups are cheap to read, so a short ttl stands in for tracking every window in memory
+        try:
+            days = windows[window][0]
+            for leaderboard in board[1].leaderboards.values():
+                leaderboard.seed(await self.query(leaderboard.field, leaderboard.size, guild_id, days))
+            board[0] = time.monotonic() + self.ttl
+        finally:
+            board[2] = None
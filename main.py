@@ -1,23 +1,106 @@
 import asyncio
-from captchas import generate_captcha, delete_captcha
+from cluster import FileCoordinator, MemoryCoordinator
+import database
+from database import get_games_count, get_skips
 from datetime import datetime
+from dispatch import MessageFilter
+import economy
 import discord
 from discord.ext import commands
+from io import BytesIO
+from journal import SessionJournal
+from leaderboards import Leaderboard, LeaderboardEmbeds, WindowLeaderboards, parse_posts, windows
+from members import MemberCache
+import metrics
+from metrics import discord_request_seconds, games_expired, games_lost, games_started, rounds_won
 import os
-from pymongo.mongo_client import MongoClient
-from pymongo.results import InsertOneResult, UpdateResult
-from timer import get_countdown
+from pool import CaptchaPool
+from ratelimit import RateLimited, RateLimiter, TokenBuckets
+from renderer import Renderer
+from roles import RoleAwards
+from sessions import AWAITING, SessionRegistry
+import time
+from timer import RoundTimer, get_countdown
+import uuid
+from watchdog import LoopWatchdog
+from writebehind import GameWriter
 
 token= os.environ.get("DISCORD_TOKEN")
 database_url = os.environ.get("DATABASE_URL")
-
-mongo = MongoClient(database_url)
-
-db = mongo.captcha
-players = db["players"]
+pool_size = int(os.environ.get("CAPTCHA_POOL_SIZE", 50))
+pool_watermark = int(os.environ.get("CAPTCHA_POOL_WATERMARK", 20))
+render_workers = int(os.environ.get("CAPTCHA_WORKERS", os.cpu_count() or 1))
+render_batch_size = int(os.environ.get("CAPTCHA_BATCH_SIZE", 10))
+game_spool_path = os.environ.get("GAME_SPOOL_PATH", "pending_games.jsonl")
+game_batch_size = int(os.environ.get("GAME_BATCH_SIZE", database.recent_games_size))
+game_flush_interval = float(os.environ.get("GAME_FLUSH_INTERVAL", 5))
+member_cache_size = int(os.environ.get("MEMBER_CACHE_SIZE", 10000))
+member_cache_ttl = float(os.environ.get("MEMBER_CACHE_TTL", 600))
+shard_count = os.environ.get("SHARD_COUNT")
+shard_ids = os.environ.get("SHARD_IDS")
+if shard_ids is not None and not shard_ids.strip():
+    # an empty pin would mean every shard, which another cluster already runs
+    raise ValueError("SHARD_IDS is set but empty, this cluster has no shards to run")
+cluster_id = os.environ.get("CLUSTER_ID")
+coordinator_path = os.environ.get("COORDINATOR_PATH")
+user_rate_capacity = float(os.environ.get("RATE_LIMIT_USER_CAPACITY", 10))
+user_rate = float(os.environ.get("RATE_LIMIT_USER_RATE", 0.5))
+guild_rate_capacity = float(os.environ.get("RATE_LIMIT_GUILD_CAPACITY", 60))
+guild_rate = float(os.environ.get("RATE_LIMIT_GUILD_RATE", 5))
+metrics_port = os.environ.get("METRICS_PORT")
+loop_lag_threshold = float(os.environ.get("LOOP_LAG_THRESHOLD", 0.25))
+session_journal_path = os.environ.get("SESSION_JOURNAL_PATH", "sessions.jsonl")
+leaderboard_post_windows = os.environ.get("LEADERBOARD_POST_WINDOWS", "all")
+role_edit_capacity = float(os.environ.get("ROLE_EDIT_CAPACITY", 5))
+role_edit_rate = float(os.environ.get("ROLE_EDIT_RATE", 1))
+legacy_captcha_dir = "/usr/bot/captcha-bot/captchas"
+
+database.connect(database.create_client(database_url))
 
 guild = None
-captchas = {}
+metrics_server = None
+sessions_restored = False
+rate_limiter = RateLimiter(
+    TokenBuckets(user_rate_capacity, user_rate),
+    TokenBuckets(guild_rate_capacity, guild_rate),
+    {
+        'statistics': 5,
+        'leaderboard': 3,
+        'play': 2,
+        'skip': 2,
+        'buy': 2,
+        'coins': 1,
+        'vote': 1
+    }
+)
+coordinator = FileCoordinator(coordinator_path) if coordinator_path else MemoryCoordinator()
+sessions = SessionRegistry(SessionJournal(session_journal_path), coordinator, cluster_id)
+message_filter = MessageFilter(sessions, ';', 1201256347430289619)
+leaderboards = {
+    'high_score': Leaderboard('high_score'),
+    'total_score': Leaderboard('total_score'),
+    'total_games': Leaderboard('total_games')
+}
+leaderboard_embeds = LeaderboardEmbeds(leaderboards, "Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP")
+leaderboard_posts = parse_posts(leaderboard_post_windows)
+window_leaderboards = WindowLeaderboards(database.get_window_top, "Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP")
+member_cache = MemberCache(member_cache_size, member_cache_ttl)
+role_awards = RoleAwards(TokenBuckets(role_edit_capacity, role_edit_rate), member_cache_size, member_cache_ttl)
+round_timer = RoundTimer()
+loop_watchdog = LoopWatchdog(loop_lag_threshold)
+captcha_pool = CaptchaPool(Renderer(render_workers, render_batch_size), pool_size, pool_watermark)
+
+metrics.Gauge("active_sessions", "Games currently in progress", lambda: len(sessions))
+metrics.Gauge("captcha_pool_size", "Rendered captchas ready to send", lambda: len(captcha_pool.captchas))
+metrics.CallbackCounter("captcha_pool_hits_total", "Captchas served from the pool", lambda: captcha_pool.hits)
+metrics.CallbackCounter("captcha_pool_misses_total", "Captchas rendered on demand", lambda: captcha_pool.misses)
+metrics.CallbackCounter("captcha_pool_errors_total", "Failed captcha pool refills", lambda: captcha_pool.errors)
+metrics.CallbackCounter("messages_processed_total", "Messages passed to on_message", lambda: message_filter.processed)
+metrics.CallbackCounter("messages_dropped_total", "Messages dropped by the fast-path filter", lambda: message_filter.dropped)
+metrics.CallbackCounter("commands_rate_limited_total", "Commands rejected by the rate limiter", lambda: rate_limiter.limited)
+metrics.Gauge("pending_game_writes", "Finished games waiting to be written", lambda: len(game_writer.pending))
+metrics.Gauge("pending_role_awards", "Players waiting for a role award check", lambda: len(role_awards.pending))
+metrics.CallbackCounter("roles_awarded_total", "Roles awarded", lambda: role_awards.awarded)
 role_thresholds = None
 novice = None
 apprentice = None
@@ -29,150 +112,85 @@ overlord = None
 
 intents = discord.Intents.default()
 intents.message_content = True
+intents.members = os.environ.get("MEMBERS_INTENT") == "1"
 
-bot = commands.Bot(command_prefix=';', intents=intents)
+class CaptchaBot(commands.AutoShardedBot):
+    async def close(self):
+        await game_writer.stop()
+        await super().close()
 
-async def save_game(player_id, guild_id, score):
-    game = {
-        'datetime': datetime.now(),
-        'guild_id': guild_id,
-        'score': score
-    }
+    async def on_command_error(self, context, exception):
+        if isinstance(exception, RateLimited):
+            embed = discord.Embed(
+                title="Slow Down",
+                description=f"You are using commands too quickly.\nTry again in **{exception.retry_after:.0f} seconds**.\n\n{context.author.mention}",
+                color=discord.Color.red()
+            )
+            embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
+            await context.send(embed=embed)
+            return
+        await super().on_command_error(context, exception)
+
+bot = CaptchaBot(
+    command_prefix=';',
+    intents=intents,
+    shard_count=int(shard_count) if shard_count else None,
+    shard_ids=[int(shard_id) for shard_id in shard_ids.split(",")] if shard_ids else None
+)
 
+async def write_games(records):
+    for player in await database.write_games(records, cluster_id or 0):
+        for leaderboard in leaderboards.values():
+            leaderboard.update(player['_id'], player[leaderboard.field])
+
+game_writer = GameWriter(write_games, game_spool_path, min(game_batch_size, database.recent_games_size), game_flush_interval)
+
+async def save_game(player_id, guild_id, score):
     multiplier = await check_for_boost(player_id)
     coins = score*10*multiplier
 
-    player = players.find_one({'_id': player_id})
-    if player is None:
-         players.insert_one({'_id': player_id, 'games': [game], 'coins': coins})
-    else:
-        players.update_one({'_id': player_id}, {'$push': {'games': game}, "$inc": {"coins": coins}}, upsert=True)
+    game_writer.add({
+        '_id': uuid.uuid4().hex,
+        'player_id': player_id,
+        'datetime': datetime.now(),
+        'guild_id': guild_id,
+        'score': score,
+        'coins': coins
+    })
     return multiplier, coins
 
-async def get_games_count():
-    games_query = [
-        {
-            "$group": {
-                "_id": None,
-                "total_score": {"$sum": {"$sum": "$games.score"}}  
-            }
-        }
-    ]
-
-    return list(players.aggregate(games_query))[0]["total_score"]
+async def check_for_boost(player_id):
+    premium = member_cache.get(player_id)
+    if premium is None:
+        player = guild.get_member(player_id)
+        if player is None:
+            try:
+                player = await guild.fetch_member(player_id)
+            except discord.NotFound:
+                player = None
+            except Exception as e:
+                return 1
 
-async def get_skips(player_id): 
-    player_object = players.find_one({"_id": player_id})
+        premium = player is not None and player.premium_since is not None
+        member_cache.set(player_id, premium)
 
-    if player_object is None:
-        return None
+    if premium:
+        return 2
     else:
-        return player_object.get("skips")
+        return 1
 
-async def check_roles(player_id, score, channel):
-    guild = bot.get_guild(1201163257461866596)
-    player = await guild.fetch_member(player_id)
-    
-    new_roles = []
-    for role, threshold in role_thresholds.items():
-        if role not in player.roles and score >= threshold:
-            new_roles.append(role.name)
-            await player.add_roles(role)
-            embed = discord.Embed(
-                title="New Title Achieved",
-                description=f"Congratulations!\nYou earned the **{role.name}** role.\nThis was earned by scoring more than {threshold}!\n\n<@{player_id}>",
-                color=discord.Color.purple()
-            )
-            embed.set_thumbnail(url=player.avatar.url)
-            await channel.send(embed=embed)
-    return new_roles
+async def get_leaderboard_embeds(window, guild=None):
+    if window == 'all' and guild is None:
+        return leaderboard_embeds.get(bot.user.avatar.url)
 
-async def check_for_boost(player_id):
-    try:
-        player = await guild.fetch_member(player_id)
-    except Exception as e:
-        return 1
-        
-    if player is None:
-        return 1
+    label = f"{guild.name if guild else 'Global'}, {windows[window][1]}"
+    return await window_leaderboards.get(guild.id if guild else None, window, label, bot.user.avatar.url)
 
-    if player.premium_since is None:
-        return 1
-    else:
-        return 2
+async def update_leaderboards():
+    lb_channel = bot.get_channel(1201185111815762001) or await bot.fetch_channel(1201185111815762001)
 
-async def update_leaderboards(guild):
-    lb_channel = guild.get_channel(1201185111815762001)
-            
-    most_games_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "total_games": {"$sum": 1}}},
-        {"$sort": {"total_games": -1}},
-        {"$limit": 10}
-    ]
-    top_10_most_games = list(players.aggregate(most_games_query))
-            
-    most_games_string = ""
-    for i, result in enumerate(top_10_most_games, 1):
-        player_id = result["_id"]["player_id"]
-        total_games = result["total_games"]
-        most_games_string += f"{i}. <@{player_id}> - {total_games} games\n"
-        
-    most_sum_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "total_score": {"$sum": "$games.score"}}},
-        {"$sort": {"total_score": -1}},
-        {"$limit": 10}
-    ]
-    top_10_sum_scores = list(players.aggregate(most_sum_query))
-        
-    most_sum_scores_string = ""
-    for i, result in enumerate(top_10_sum_scores, 1):
-        player_id = result["_id"]["player_id"]
-        total_score = result["total_score"]
-        most_sum_scores_string += f"{i}. <@{player_id}> - {total_score}\n"
-        
-    high_score_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "high_score": {"$max": "$games.score"}}},
-        {"$sort": {"high_score": -1}},
-        {"$limit": 10}
-    ]
-    top_10_high_scores = list(players.aggregate(high_score_query))
-        
-    top_high_score_string = ""
-    for i, result in enumerate(top_10_high_scores, 1):
-        player_id = result["_id"]["player_id"]
-        high_score = result["high_score"]
-        top_high_score_string += f"{i}. <@{player_id}> - {high_score}\n"
-        
-    embed = discord.Embed(
-        title='Leaderboard - High Score',
-        description=f"{top_high_score_string}",
-        color=discord.Color.purple()
-    )
-    embed.set_thumbnail(url=bot.user.avatar.url)
-    embed.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await lb_channel.send(embed=embed)
-        
-    embed2 = discord.Embed(
-        title='Leaderboard - Total Score',
-        description=f"{most_sum_scores_string}",
-        color=discord.Color.purple()
-    )
-    embed2.set_thumbnail(url=bot.user.avatar.url)
-    embed2.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await lb_channel.send(embed=embed2)
-        
-    embed3 = discord.Embed(
-        title='Leaderboard - Games Played',
-        description=f"{most_games_string}",
-        color=discord.Color.purple()
-    )
-    embed3.set_thumbnail(url=bot.user.avatar.url)
-    embed3.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await lb_channel.send(embed=embed3)
-    return
+    for window, server in leaderboard_posts:
+        await lb_channel.send(embeds=await get_leaderboard_embeds(window, guild if server else None))
 
 async def send_message_to_guild_owners():
     for guild in bot.guilds:
@@ -190,9 +208,26 @@ async def send_message_to_guild_owners():
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
 
-    global guild, novice, apprentice, explorer, enthusiast, master, grandmaster, overlord, role_thresholds
-    
-    guild = bot.get_guild(1201163257461866596)
+    global guild, metrics_server, sessions_restored, novice, apprentice, explorer, enthusiast, master, grandmaster, overlord, role_thresholds
+
+    captcha_pool.start()
+    round_timer.start()
+
+    loop_watchdog.start()
+    if metrics_port and metrics_server is None:
+        metrics_server = await metrics.start_server(int(metrics_port))
+
+    await database.create_indexes()
+    await database.seed_games_count()
+    game_writer.start()
+    for leaderboard in leaderboards.values():
+        leaderboard.seed(await database.get_top(leaderboard.field, leaderboard.size))
+
+    # clusters that don't own the home guild's shard only need it for REST lookups
+    guild = bot.get_guild(1201163257461866596) or await bot.fetch_guild(1201163257461866596)
+
+    for member in guild.members:
+        member_cache.set(member.id, member.premium_since is not None)
 
     #await send_message_to_guild_owners()
     
@@ -213,177 +248,129 @@ async def on_ready():
         grandmaster: 500,
         overlord: 1000
     }
+    role_awards.configure(guild, role_thresholds)
+    role_awards.start()
+
+    if not sessions_restored:
+        sessions_restored = True
+        await restore_sessions()
 
     n = 1
     while True:
         games_count = await get_games_count()
         await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.watching, name=f"{games_count} Captchas"))
-        if n % 60 == 0:
-            await update_leaderboards(guild)
+
+        p50, p99 = loop_watchdog.percentiles()
+        print(f"Event loop lag p50 {p50*1000:.1f}ms p99 {p99*1000:.1f}ms")
+
+        # other clusters save games too, so re-read the top entries they may have changed
+        if cluster_id is not None:
+            for leaderboard in leaderboards.values():
+                leaderboard.seed(await database.get_top(leaderboard.field, leaderboard.size))
+
+        leader = await asyncio.to_thread(coordinator.acquire, 'leaderboards', cluster_id, 180)
+        if n % 60 == 0 and leader:
+            await update_leaderboards()
         n += 1
         await asyncio.sleep(60)
 
+def clean_captcha_files():
+    # captchas used to be written to disk and were left behind when a game crashed
+    if os.path.isdir(legacy_captcha_dir):
+        for name in os.listdir(legacy_captcha_dir):
+            if name.endswith(".png"):
+                os.remove(os.path.join(legacy_captcha_dir, name))
+
+async def restore_sessions():
+    clean_captcha_files()
+
+    for snapshot in sessions.journal.replay():
+        player_id = snapshot['player_id']
+        session = sessions.start(player_id, snapshot['channel'], snapshot['guild_id'])
+        await sessions.claim(player_id)
+        round_timer.schedule(('lease', player_id), sessions.lease_ttl / 3, renew_lease, session)
+        session.score = snapshot['score']
+        session.new_round(snapshot['answer'])
+        session.deadline = snapshot['deadline']
+        session.message_id = snapshot['message_id']
+
+        progress = "🔥" * (int(session.score/5)+1)
+        if session.score == 0:
+            progress = ""
+
+        try:
+            channel = bot.get_channel(session.channel) or await bot.fetch_channel(session.channel)
+            challenge = await channel.fetch_message(session.message_id)
+        except (discord.HTTPException, TypeError) as e:
+            # the challenge is gone, so settle the game with the score reached so far
+            print(f"Settling game for {player_id} after restart: {e}")
+            session.expire()
+            sessions.end(session)
+            games_expired.inc()
+            await save_game(player_id, session.guild_id, session.score)
+            continue
+
+        # rounds whose deadline passed while the bot was down expire straight away
+        round_timer.schedule(player_id, max(0, session.deadline - time.time()), expire_round, player_id, session.answer, challenge, challenge.embeds[0], channel, progress)
+
+    sessions.journal.compact(list(sessions.sessions.values()))
+    print(f"Restored {len(sessions)} games")
+
+@bot.event
+async def on_member_update(before, after):
+    if after.guild.id == 1201163257461866596:
+        member_cache.set(after.id, after.premium_since is not None)
+        role_awards.remember(after)
+
 class CustomHelpCommand(commands.HelpCommand):
     async def send_bot_help(self, mapping):
         ctx = self.context
         embed = discord.Embed(
             title="Help",
-            description="<@1200756820403306586> is a Captcha solving game.\nAnswer the captcha correctly in alloted time or you lose!\n\n`;play` - starts a game\n\n`;skip` - skips the captcha\n\n`;coins` - shows your coin balance\n\n`;buy <quantity>` - buys the a specified amount of skips\n\n`;statistics` - shows player statistics\n\n`;leaderboard` - shows global leaderboards\n\n`;vote` - vote to receive rewards\n\nContact <@838472003031793684> for support or data deletion requests.",
+            description="<@1200756820403306586> is a Captcha solving game.\nAnswer the captcha correctly in alloted time or you lose!\n\n`;play` - starts a game\n\n`;skip` - skips the captcha\n\n`;coins` - shows your coin balance\n\n`;buy <quantity>` - buys the a specified amount of skips\n\n`;statistics` - shows player statistics\n\n`;leaderboard [daily|weekly] [server]` - shows global or server leaderboards\n\n`;vote` - vote to receive rewards\n\nContact <@838472003031793684> for support or data deletion requests.",
             color=discord.Color.purple()
         )
         await ctx.send(embed=embed)
 
 bot.help_command = CustomHelpCommand()
 
-@bot.command(name='leaderboard', aliases=['lb'])
-async def stats(ctx):
-    most_games_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "total_games": {"$sum": 1}}},
-        {"$sort": {"total_games": -1}},
-        {"$limit": 10}
-    ]
-    top_10_most_games = list(players.aggregate(most_games_query))
-
-    most_games_string = ""
-    for i, result in enumerate(top_10_most_games, 1):
-        player_id = result["_id"]["player_id"]
-        total_games = result["total_games"]
-        most_games_string += f"{i}. <@{player_id}> - {total_games} games\n"
-
-    most_sum_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "total_score": {"$sum": "$games.score"}}},
-        {"$sort": {"total_score": -1}},
-        {"$limit": 10}
-    ]
-    top_10_sum_scores = list(players.aggregate(most_sum_query))
-
-    most_sum_scores_string = ""
-    for i, result in enumerate(top_10_sum_scores, 1):
-        player_id = result["_id"]["player_id"]
-        total_score = result["total_score"]
-        most_sum_scores_string += f"{i}. <@{player_id}> - {total_score}\n"
-
-    high_score_query = [
-        {"$unwind": "$games"},
-        {"$group": {"_id": {"player_id": "$_id"}, "high_score": {"$max": "$games.score"}}},
-        {"$sort": {"high_score": -1}},
-        {"$limit": 10}
-    ]
-    top_10_high_scores = list(players.aggregate(high_score_query))
-
-    top_high_score_string = ""
-    for i, result in enumerate(top_10_high_scores, 1):
-        player_id = result["_id"]["player_id"]
-        high_score = result["high_score"]
-        top_high_score_string += f"{i}. <@{player_id}> - {high_score}\n"
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.command_started = time.perf_counter()
 
-    embed = discord.Embed(
-        title='Leaderboard - High Score',
-        description=f"{top_high_score_string}",
-        color=discord.Color.purple()
-    )
-    embed.set_thumbnail(url=bot.user.avatar.url)
-    embed.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await ctx.send(embed=embed)
+@bot.after_invoke
+async def stop_command_timer(ctx):
+    metrics.command_seconds.observe(time.perf_counter() - ctx.command_started, ctx.command.qualified_name)
+
+@bot.check
+async def rate_limit(ctx):
+    return rate_limiter.check(ctx.command.qualified_name, ctx.author.id, ctx.guild.id if ctx.guild else None)
+
+@bot.command(name='leaderboard', aliases=['lb'])
+async def stats(ctx, *options):
+    options = [option.lower() for option in options]
+    window = next((option for option in options if option in windows), 'all')
+    guild = ctx.guild if 'server' in options else None
 
-    embed2 = discord.Embed(
-        title='Leaderboard - Total Score',
-        description=f"{most_sum_scores_string}",
-        color=discord.Color.purple()
-    )
-    embed2.set_thumbnail(url=bot.user.avatar.url)
-    embed2.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await ctx.send(embed=embed2)
-
-    embed3 = discord.Embed(
-        title='Leaderboard - Games Played',
-        description=f"{most_games_string}",
-        color=discord.Color.purple()
-    )
-    embed3.set_thumbnail(url=bot.user.avatar.url)
-    embed3.set_footer(text="Leaderboards updated hourly here: https://discord.gg/gkpxVhMZqP") 
-    await ctx.send(embed=embed3)
+    await ctx.send(embeds=await get_leaderboard_embeds(window, guild))
 
 @bot.command(name='statistics', aliases=['stats'])
 async def statistics(ctx):
-    main_query = [
-        {'$match': {'_id': ctx.message.author.id}},
-        {'$unwind': '$games'},
-        {'$group': {
-            '_id': '$_id',
-            'top_score': {'$max': '$games.score'},
-            'average_score': {'$avg': '$games.score'},
-            'total_score': {'$sum': '$games.score'},
-            'total_games': {'$sum': 1}
-        }},
-        {'$project': {'_id': 0, 'top_score': 1, 'average_score': 1, 'total_score': 1, 'total_games': 1}}
-    ]
-    main_result = list(players.aggregate(main_query))
-
-    total_score_rank_query = [
-        {
-            "$unwind": "$games"
-        },
-        {
-            "$group": {
-                "_id": "$_id",
-                "total_score": {"$sum": "$games.score"}
-            }
-        },
-        {
-            "$sort": {
-                "total_score": -1
-            }
-        },
-        {
-            "$project": {
-                "_id": 1,
-                "total_score": 1
-            }
-        }
-    ]
-
-    total_score_rank_result = list(players.aggregate(total_score_rank_query))
-    total_score_player_index = next((index for index, player in enumerate(total_score_rank_result) if player["_id"] == ctx.message.author.id), None)+1
-
-    high_score_rank_query = [
-        {
-            "$unwind": "$games"
-        },
-        {
-            "$group": {
-                "_id": "$_id",
-                "high_score": {"$max": "$games.score"}
-            }
-        },
-        {
-            "$sort": {
-                "high_score": -1
-            }
-        },
-        {
-            "$project": {
-                "_id": 1,
-                "high_score": 1
-            }
-        }
-    ]
-
-    high_score_rank_result = list(players.aggregate(high_score_rank_query))
-    high_score_player_index = next((index for index, player in enumerate(high_score_rank_result) if player["_id"] == ctx.message.author.id), None)+1
-
-    if main_result:
+    player = await database.get_player(ctx.message.author.id, {'total_games': 1, 'total_score': 1, 'high_score': 1})
+
+    if player and player.get('total_games'):
+        total_score_player_index = await database.get_rank('total_score', player['total_score'])
+        high_score_player_index = await database.get_rank('high_score', player['high_score'])
+
         embed = discord.Embed(
             title='Player Statistics',
             color=discord.Color.purple()
         )
         embed.add_field(name='Player Name', value=f"{ctx.author.name}", inline=False)
-        embed.add_field(name='Total Games', value=f"{main_result[0]['total_games']}", inline=True)
-        embed.add_field(name='Total Score', value=f"{main_result[0]['total_score']}", inline=True)
-        embed.add_field(name='High Score', value=f"{main_result[0]['top_score']}", inline=True)
-        embed.add_field(name='Accuracy', value=f"{int(main_result[0]['total_score'])/(int(main_result[0]['total_score'])+main_result[0]['total_games'])*100:.2f}%", inline=True)
+        embed.add_field(name='Total Games', value=f"{player['total_games']}", inline=True)
+        embed.add_field(name='Total Score', value=f"{player['total_score']}", inline=True)
+        embed.add_field(name='High Score', value=f"{player['high_score']}", inline=True)
+        embed.add_field(name='Accuracy', value=f"{int(player['total_score'])/(int(player['total_score'])+player['total_games'])*100:.2f}%", inline=True)
         embed.add_field(name='Total Score Rank', value=f"#{total_score_player_index}", inline=True)
         embed.add_field(name='High Score Rank', value=f"#{high_score_player_index}", inline=True)
         embed.set_thumbnail(url=ctx.message.author.avatar.url)
@@ -392,51 +379,80 @@ async def statistics(ctx):
     else:
         await ctx.send(f"<@{ctx.message.author.id}>, no game results found. Get playing!")
 
+async def expire_round(player_id, random_string, challenge, embed, channel, progress):
+    async with sessions.lock(player_id):
+        session = sessions.get(player_id)
+        if session is None or session.state != AWAITING or session.answer != random_string:
+            return
+        session.expire()
+        sessions.end(session)
+        games_expired.inc()
+
+    multiplier, coins = await save_game(player_id, channel.guild.id, session.score)
+    embed.title = "Time is up!"
+    embed.description = f"You have lost.\nThe correct answer was **{random_string}**.\n\n**Final Score:** {session.score}\n{progress}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier).\n\n<@{player_id}>"
+    embed.set_footer(text="Play again with ;p or ;play")
+    with discord_request_seconds.labels('edit').time():
+        await challenge.edit(embed=embed)
+    if channel.guild.id == 1201163257461866596:
+        role_awards.queue(player_id, session.score, channel)
+
+async def renew_lease(session):
+    # the lease is taken once per game and extended from the timer, not on every round
+    if await sessions.renew(session):
+        round_timer.schedule(('lease', session.player_id), sessions.lease_ttl / 3, renew_lease, session)
+
 @bot.command(name='play', aliases=['p'])
 async def play(ctx):
-    captcha_info = captchas.get(ctx.message.author.id, None)
-    if captcha_info:
-        embed = discord.Embed(
-                title="Game Already Running",
-                description=f"You already are playing a game. Please finish it before starting a new game.\n\n<@{ctx.message.author.id}>",
-                color=discord.Color.red()
-            )
-        embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
-        await ctx.send(embed=embed)
-        return
-    
-    random_string = generate_captcha()
-    
-    file = discord.File(f"/usr/bot/captcha-bot/captchas/{random_string}.png", filename=f"{random_string}.png")
-    
-    embed = discord.Embed(
-        title='Solve the Captcha below',
-        description=f'Time is up <t:{get_countdown()}:R>\n\n<@{ctx.message.author.id}>',
-        color=discord.Color.purple()
-    )
-    embed.set_image(url=f"attachment://{random_string}.png")
+    player_id = ctx.message.author.id
+    async with sessions.lock(player_id):
+        # the captcha is fetched before the session exists, so a render error can't leave a game behind
+        running = sessions.get(player_id) is not None
+        if not running:
+            random_string, image = await captcha_pool.get()
+            running = not await sessions.claim(player_id)
+
+        if running:
+            embed = discord.Embed(
+                    title="Game Already Running",
+                    description=f"You already are playing a game. Please finish it before starting a new game.\n\n<@{ctx.message.author.id}>",
+                    color=discord.Color.red()
+                )
+            embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
+            await ctx.send(embed=embed)
+            return
 
-    challenge = await ctx.send(embed=embed, file=file)
+        session = sessions.start(player_id, ctx.channel.id, ctx.guild.id if ctx.guild else None)
+        games_started.inc()
+        round_timer.schedule(('lease', player_id), sessions.lease_ttl / 3, renew_lease, session)
+        session.new_round(random_string)
 
-    player_id = ctx.message.author.id
-    captchas[player_id] = {
-        'captcha_string': random_string,
-        'score': 0
-    }
+        file = discord.File(BytesIO(image), filename=f"{random_string}.png")
 
-    await asyncio.sleep(10)
-    if captchas.get(player_id, {}).get('captcha_string') == random_string:
-        multiplier, coins = await save_game(player_id, ctx.guild.id, 0)
-        embed.title = "Time is up!"
-        embed.description = f"You have lost.\nThe correct answer was **{random_string}**.\n\n**Final Score:** {captchas[player_id]['score']}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier).\n\nPlay again with `;p` or `;play`\n\n<@{player_id}>"
-        await challenge.edit(embed=embed)
-        delete_captcha(random_string)
-        del captchas[player_id]
-    else:
-        return
+        embed = discord.Embed(
+            title='Solve the Captcha below',
+            description=f'Time is up <t:{get_countdown()}:R>\n\n<@{ctx.message.author.id}>',
+            color=discord.Color.purple()
+        )
+        embed.set_image(url=f"attachment://{random_string}.png")
+
+        try:
+            with discord_request_seconds.labels('send').time():
+                challenge = await ctx.send(embed=embed, file=file)
+        except discord.HTTPException:
+            session.lose()
+            sessions.end(session)
+            raise
+        session.message_id = challenge.id
+        sessions.checkpoint(session)
+
+        round_timer.schedule(player_id, 10, expire_round, player_id, random_string, challenge, embed, ctx.channel, "")
 
 @bot.event
 async def on_message(message):
+    if not message_filter.accept(message):
+        return
+
     player_id = message.author.id
     
     if message.author == bot.user:
@@ -445,7 +461,7 @@ async def on_message(message):
     if message.channel.id == 1201256347430289619 and message.author.bot:
         user = await bot.fetch_user(message.content)
         user_id = int(user.id)
-        player = players.find_one({"_id": user_id})
+        player = await economy.reward_vote(user_id, 10)
         if player is None:
             embed = discord.Embed(
                 title="Vote Confirmation",
@@ -456,8 +472,6 @@ async def on_message(message):
             await user.send(embed=embed) 
             return
         else:
-            players.update_one({"_id": user_id}, {"$inc": {"skips": 10}})
-            player = players.find_one({"_id": user_id})
             skips = player["skips"]
             embed = discord.Embed(
                 title="Vote Confirmation",
@@ -468,148 +482,137 @@ async def on_message(message):
             await user.send(embed=embed) 
             return
         
-    if not message.content.startswith(";"):
-        try:
-            captcha_info = captchas.get(player_id)
-        except Exception as e:
-            captcha_info = None
-
-        if captcha_info:
-            guess = message.content
-            answer = captcha_info['captcha_string']
-
-            if message.content.lower() == captcha_info['captcha_string'].lower():
-                captchas[player_id]['score'] += 1
-                captchas[player_id]['captcha_string'] = ""
-                delete_captcha(answer)
-
-                random_string = generate_captcha()
-                
-                file = discord.File(f"/usr/bot/captcha-bot/captchas/{random_string}.png", filename=f"{random_string}.png")
-                
-                score = captchas[player_id]['score']
-                progress = "🔥" * (int(score/5)+1)
-                if score == 0:
-                    progress = ""
-
-                skips = await get_skips(player_id)
-                if skips is None:
-                    skips = 0
-                
-                embed = discord.Embed(
-                    title='Solve the Captcha below',
-                    description=f"You have **{skips} skips** left.\nYou can use `;skip` or `;s` to skip.\n\n**Score:** {score}\n{progress}\n\nTime is up <t:{get_countdown()}:R>\n\n<@{message.author.id}>",
-                    color=discord.Color.purple()
-                )
-                embed.set_image(url=f"attachment://{random_string}.png")
-
-                challenge = await message.channel.send(embed=embed, file=file)
-
-                captchas[player_id]['captcha_string'] = random_string
-    
-                score = captchas[player_id]['score']
-                await asyncio.sleep(10)
-                if captchas.get(player_id, {}).get('captcha_string') == random_string:
-                    multiplier, coins = await save_game(player_id, message.guild.id, captchas[player_id]['score'])
-                    embed.title = "Time is up!"
-                    embed.description = f"You have lost.\nThe correct answer was **{random_string}**.\n\n**Final Score:** {captchas[player_id]['score']}\n{progress}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier)\n\n<@{player_id}>"
-                    embed.set_footer(text="Play again with ;p or ;play")
-                    await challenge.edit(embed=embed)
-                    delete_captcha(random_string)
-                    if message.guild.id == 1201163257461866596:
-                        await check_roles(player_id, captchas[player_id]['score'], message.channel)
-                    del captchas[player_id]
-            else:
-                score = captchas[player_id]['score']
-                progress = "🔥" * (int(score/5)+1)
-                if score == 0:
-                    progress = ""
-                multiplier, coins = await save_game(player_id, message.guild.id, captchas[player_id]['score'])
-                embed = discord.Embed(
-                    title="Wrong Answer",
-                    description=f"You have lost.\nThe correct answer was **{answer}**.\n\n**Final Score:** {captchas[player_id]['score']}\n{progress}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier).\n\n<@{player_id}>",
-                    color=discord.Color.purple()
-                )
-                embed.set_footer(text="Play again with ;p or ;play")
-                await message.channel.send(embed=embed)
-                delete_captcha(answer)
-                if message.guild.id == 1201163257461866596:
-                    await check_roles(player_id, captchas[player_id]['score'], message.channel)
-                del captchas[player_id]
+    if not message.content.startswith(";") and sessions.get(player_id):
+        async with sessions.lock(player_id):
+            session = sessions.get(player_id)
+            # only the captcha's channel counts, so chatter elsewhere (like the vote channel) can't end a game
+            if session is not None and session.state == AWAITING and message.channel.id == session.channel:
+                await answer_captcha(session, message)
                 
     await bot.process_commands(message)
 
-@bot.command(name='skip', aliases=['s'])
-async def skip(ctx):
-    player_id = ctx.message.author.id
-    try:
-        captcha_info = captchas.get(player_id)
-    except Exception as e:
-        return
+async def answer_captcha(session, message):
+    player_id = session.player_id
+    answer = session.answer
 
-    if captcha_info is None:
-        embed = discord.Embed(
-            title="Skip Failure",
-            description=f"You must be playing a game to use a skip.\n\n{ctx.author.mention}",
-            color=discord.Color.red()
-        )
-        embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
-        await ctx.send(embed=embed)
-        return
+    if message.content.lower() == answer.lower():
+        # anything that can fail runs before the session moves on; if it raises,
+        # the round stays open and its timer settles the game
+        random_string, image = await captcha_pool.get()
+        skips = await get_skips(player_id)
+        if skips is None:
+            skips = 0
 
-    skips = await get_skips(player_id)
-    if skips is None:
-        skips = 0
-    if skips > 0:
-        players.update_one({"_id": player_id}, {"$inc": {"skips": -1}})
-        
-        captcha_info = captchas.get(player_id)
-        answer = captcha_info['captcha_string']
-        captchas[player_id]['captcha_string'] = ""
-        delete_captcha(answer)
+        session.solve()
+        rounds_won.inc()
+        session.new_round(random_string)
 
-        random_string = generate_captcha()
+        file = discord.File(BytesIO(image), filename=f"{random_string}.png")
 
-        file = discord.File(f"/usr/bot/captcha-bot/captchas/{random_string}.png", filename=f"{random_string}.png")
-                
-        score = captchas[player_id]['score']
+        score = session.score
         progress = "🔥" * (int(score/5)+1)
-        progress += "\n"
         if score == 0:
             progress = ""
-        
+
         embed = discord.Embed(
             title='Solve the Captcha below',
-            description=f"You have chosen to skip.\nYou have **{skips-1} skips** left.\n\n**Score:** {score}\n{progress}\nTime is up <t:{get_countdown()}:R>\n\n<@{ctx.message.author.id}>",
+            description=f"You have **{skips} skips** left.\nYou can use `;skip` or `;s` to skip.\n\n**Score:** {score}\n{progress}\n\nTime is up <t:{get_countdown()}:R>\n\n<@{message.author.id}>",
             color=discord.Color.purple()
         )
         embed.set_image(url=f"attachment://{random_string}.png")
 
-        challenge = await ctx.send(embed=embed, file=file)
-
-        captchas[player_id]['captcha_string'] = random_string
-    
-        score = captchas[player_id]['score']
-        await asyncio.sleep(10)
-        if captchas.get(player_id, {}).get('captcha_string') == random_string:
-            multiplier, coins = await save_game(player_id, ctx.message.guild.id, captchas[player_id]['score'])
-            embed.title = "Time is up!"
-            embed.description = f"You have lost.\nThe correct answer was **{random_string}**.\n\n**Final Score:** {captchas[player_id]['score']}\n{progress}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier).\n\n<@{player_id}>"
-            embed.set_footer(text="Play again with ;p or ;play")
-            await challenge.edit(embed=embed)
-            delete_captcha(random_string)
-            if ctx.message.guild.id == 1201163257461866596:
-                new_roles = await check_roles(player_id, captchas[player_id]['score'], ctx.message.channel)
-            del captchas[player_id]
+        try:
+            with discord_request_seconds.labels('send').time():
+                challenge = await message.channel.send(embed=embed, file=file)
+        except discord.HTTPException:
+            session.lose()
+            sessions.end(session)
+            raise
+        session.message_id = challenge.id
+        sessions.checkpoint(session)
+
+        round_timer.schedule(player_id, 10, expire_round, player_id, random_string, challenge, embed, message.channel, progress)
     else:
+        round_timer.cancel(player_id)
+        session.lose()
+        sessions.end(session)
+        games_lost.inc()
+
+        score = session.score
+        progress = "🔥" * (int(score/5)+1)
+        if score == 0:
+            progress = ""
+        multiplier, coins = await save_game(player_id, message.guild.id, score)
         embed = discord.Embed(
-            title="Skip Failure",
-            description=f"You have no skips left.\nYou can get more skips from `;buy skips` or `;vote`.\n\n{ctx.author.mention}",
-            color=discord.Color.red()
+            title="Wrong Answer",
+            description=f"You have lost.\nThe correct answer was **{answer}**.\n\n**Final Score:** {score}\n{progress}\n\nYou earned **{coins} :coin: coins** ({multiplier}x multiplier).\n\n<@{player_id}>",
+            color=discord.Color.purple()
         )
-        embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
-        await ctx.send(embed=embed)
-        return
+        embed.set_footer(text="Play again with ;p or ;play")
+        await message.channel.send(embed=embed)
+        if message.guild.id == 1201163257461866596:
+            role_awards.queue(player_id, score, message.channel)
+
+@bot.command(name='skip', aliases=['s'])
+async def skip(ctx):
+    player_id = ctx.message.author.id
+    async with sessions.lock(player_id):
+        session = sessions.get(player_id)
+
+        if session is None or session.state != AWAITING:
+            embed = discord.Embed(
+                title="Skip Failure",
+                description=f"You must be playing a game to use a skip.\n\n{ctx.author.mention}",
+                color=discord.Color.red()
+            )
+            embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
+            await ctx.send(embed=embed)
+            return
+
+        # fetched before the skip is spent, so a render error doesn't cost the player a skip
+        random_string, image = await captcha_pool.get()
+        player = await economy.use_skip(player_id)
+        if player is not None:
+            skips = player["skips"]
+
+            session.new_round(random_string)
+            sessions.move(session, ctx.channel.id)
+
+            file = discord.File(BytesIO(image), filename=f"{random_string}.png")
+
+            score = session.score
+            progress = "🔥" * (int(score/5)+1)
+            progress += "\n"
+            if score == 0:
+                progress = ""
+
+            embed = discord.Embed(
+                title='Solve the Captcha below',
+                description=f"You have chosen to skip.\nYou have **{skips} skips** left.\n\n**Score:** {score}\n{progress}\nTime is up <t:{get_countdown()}:R>\n\n<@{ctx.message.author.id}>",
+                color=discord.Color.purple()
+            )
+            embed.set_image(url=f"attachment://{random_string}.png")
+
+            try:
+                with discord_request_seconds.labels('send').time():
+                    challenge = await ctx.send(embed=embed, file=file)
+            except discord.HTTPException:
+                session.lose()
+                sessions.end(session)
+                raise
+            session.message_id = challenge.id
+            sessions.checkpoint(session)
+
+            round_timer.schedule(player_id, 10, expire_round, player_id, random_string, challenge, embed, ctx.channel, progress)
+        else:
+            embed = discord.Embed(
+                title="Skip Failure",
+                description=f"You have no skips left.\nYou can get more skips from `;buy skips` or `;vote`.\n\n{ctx.author.mention}",
+                color=discord.Color.red()
+            )
+            embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
+            await ctx.send(embed=embed)
+            return
 
 @bot.command(name='vote', aliases=['v'])
 async def vote(ctx):
@@ -624,7 +627,7 @@ async def vote(ctx):
 
 @bot.command(name='coins', aliases=['c'])
 async def coins(ctx):
-    result = players.find_one({'_id': ctx.message.author.id})
+    result = await database.get_player(ctx.message.author.id)
     try:
         coins = result["coins"]
         embed = discord.Embed(
@@ -650,36 +653,36 @@ async def buy(ctx, quantity: int = 0):
     if quantity is None or quantity < 1:
         embed = discord.Embed(
             title="Skip Purchase Failure",
-            description=f"Please specify the amount of skips you want to buy.\nEach skip costs **1000 :coin: coins**.\n\n`;buy 1`\n\n{ctx.message.author.mention}",
+            description=f"Please specify the amount of skips you want to buy.\nEach skip costs **{economy.skip_price} :coin: coins**.\n\n`;buy 1`\n\n{ctx.message.author.mention}",
             color=discord.Color.red()
         )
         embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
         await ctx.send(embed=embed)
         return
     else:
-        result = players.find_one({'_id': ctx.message.author.id})
-        try:
-            coins = result["coins"]
-            if coins > (quantity*1000):
-                players.update_one({"_id": ctx.message.author.id}, {"$inc": {"coins": -1000 * quantity, "skips": quantity}})
-                embed = discord.Embed(
-                    title="Skips Purchased",
-                    description=f"You have bought {quantity} skips for **{1000*quantity} :coin: coins**.\nYou have **{(coins-(quantity*1000))}** :coin: coins left.\n\n{ctx.author.mention}",
-                    color=discord.Color.purple()
-                )
-                embed.set_thumbnail(url="https://i.ibb.co/3kytCr7/2023446-removebg-preview.png")
-                await ctx.send(embed=embed)
-                return
-            else:
-                embed = discord.Embed(
-                    title="Skip Purchase Failure",
-                    description=f"You don't have enough coins.\n\nYou need **{1000*quantity} :coin: coins**.\nYou have **{coins} :coin: coins**.\n\n{ctx.author.mention}",
-                    color=discord.Color.red()
-                )
-                embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
-                await ctx.send(embed=embed)
-                return
-        except Exception as e:
+        player = await economy.buy_skips(ctx.message.author.id, quantity)
+        if player is not None:
+            embed = discord.Embed(
+                title="Skips Purchased",
+                description=f"You have bought {quantity} skips for **{economy.skip_price*quantity} :coin: coins**.\nYou have **{player['coins']}** :coin: coins left.\n\n{ctx.author.mention}",
+                color=discord.Color.purple()
+            )
+            embed.set_thumbnail(url="https://i.ibb.co/3kytCr7/2023446-removebg-preview.png")
+            await ctx.send(embed=embed)
+            return
+
+        result = await database.get_player(ctx.message.author.id, {'coins': 1})
+        coins = result.get("coins") if result else None
+        if coins is not None:
+            embed = discord.Embed(
+                title="Skip Purchase Failure",
+                description=f"You don't have enough coins.\n\nYou need **{economy.skip_price*quantity} :coin: coins**.\nYou have **{coins} :coin: coins**.\n\n{ctx.author.mention}",
+                color=discord.Color.red()
+            )
+            embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
+            await ctx.send(embed=embed)
+            return
+        else:
             embed = discord.Embed(
                 title="Skip Purchase Failure",
                 description=f"You don't have any :coin: coins to buy skips.\nStart playing to get some!\n\n{ctx.author.mention}",
@@ -688,5 +691,6 @@ async def buy(ctx, quantity: int = 0):
             embed.set_thumbnail(url="https://i.ibb.co/tptVTTH/toppng-com-red-x-in-circle-x-ico-2000x2000-removebg-preview.png")
             await ctx.send(embed=embed)
             return
-                             
-bot.run(token)
+
+if __name__ == '__main__':
+    bot.run(token)
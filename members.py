@@ -0,0 +1,30 @@
+import time
+from collections import OrderedDict
+
+class MemberCache:
+    def __init__(self, maxsize=10000, ttl=600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, player_id):
+        entry = self.entries.get(player_id)
+        if entry is None:
+            return None
+
+        premium, expires = entry
+        if expires < time.monotonic():
+            del self.entries[player_id]
+            return None
+
+        self.entries.move_to_end(player_id)
+        return premium
+
+    def set(self, player_id, premium):
+        self.entries[player_id] = (premium, time.monotonic() + self.ttl)
+        self.entries.move_to_end(player_id)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, player_id):
+        self.entries.pop(player_id, None)
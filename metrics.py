@@ -0,0 +1,152 @@
+import bisect
+import functools
+import time
+from aiohttp import web
+
+default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+metrics = []
+
+def format_labels(label, value):
+    return f'{{{label}="{value}"}}' if label else ""
+
+class Counter:
+    def __init__(self, name, description, label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+        metrics.append(self)
+
+    def inc(self, amount=1, value=None):
+        self.values[value] = self.values.get(value, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} counter"
+        for value, count in self.values.items():
+            yield f"{self.name}{format_labels(self.label, value)} {count}"
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, description, read):
+        self.name = name
+        self.description = description
+        self.read = read
+        metrics.append(self)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {self.read()}"
+
+class CallbackCounter(Gauge):
+    # a count kept elsewhere that only grows, exported as a counter so rate() handles restarts
+    kind = "counter"
+
+class Histogram:
+    def __init__(self, name, description, label=None, buckets=default_buckets):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        metrics.append(self)
+
+    def labels(self, value):
+        return HistogramSeries(self, value)
+
+    def observe(self, seconds, value=None):
+        series = self.series.get(value)
+        if series is None:
+            series = self.series[value] = [[0] * len(self.buckets), 0, 0]
+        index = bisect.bisect_left(self.buckets, seconds)
+        if index < len(self.buckets):
+            series[0][index] += 1
+        series[1] += 1
+        series[2] += seconds
+
+    def time(self, value=None):
+        return timed(self, value)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for value, (counts, count, total) in self.series.items():
+            prefix = f'{self.label}="{value}",' if self.label else ""
+            cumulative = 0
+            for bucket, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{{{prefix}le="{bucket}"}} {cumulative}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}'
+            yield f"{self.name}_sum{format_labels(self.label, value)} {total}"
+            yield f"{self.name}_count{format_labels(self.label, value)} {count}"
+
+class HistogramSeries:
+    def __init__(self, histogram, value):
+        self.histogram = histogram
+        self.value = value
+
+    def observe(self, seconds):
+        self.histogram.observe(seconds, self.value)
+
+    def time(self):
+        return timed(self.histogram, self.value)
+
+class timed:
+    def __init__(self, histogram, value=None):
+        if isinstance(histogram, HistogramSeries):
+            histogram, value = histogram.histogram, histogram.value
+        self.histogram = histogram
+        self.value = value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, self.value)
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        self.__exit__(*exc)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.histogram.observe(time.perf_counter() - start, self.value)
+        return wrapper
+
+def render():
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+async def serve_metrics(request):
+    return web.Response(text=render(), content_type="text/plain")
+
+async def start_server(port, host="127.0.0.1"):
+    app = web.Application()
+    app.router.add_get("/metrics", serve_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+captcha_render_seconds = Histogram("captcha_render_seconds", "Time to render a batch of captchas")
+mongo_query_seconds = Histogram("mongo_query_seconds", "Time spent in MongoDB queries", "query")
+discord_request_seconds = Histogram("discord_request_seconds", "Time spent in Discord REST calls", "operation")
+command_seconds = Histogram("command_seconds", "Time to run a bot command", "command")
+loop_lag_seconds = Histogram("event_loop_lag_seconds", "How late the event loop woke a sleeping task")
+games_started = Counter("games_started_total", "Games started")
+rounds_won = Counter("rounds_won_total", "Captchas answered correctly")
+games_lost = Counter("games_lost_total", "Games ended by a wrong answer")
+games_expired = Counter("games_expired_total", "Games ended by the round timer")
@@ -0,0 +1,97 @@
+from database import day_key, rollup_buckets, rollup_key
+import os
+import sys
+from pymongo import UpdateOne
+from pymongo.mongo_client import MongoClient
+
+database_url = os.environ.get("DATABASE_URL")
+
+mongo = MongoClient(database_url)
+
+db = mongo.captcha
+players = db["players"]
+games = db["games"]
+rollups = db["rollups"]
+
+def rollup_requests(player_id, history):
+    totals = {}
+    for game in history:
+        for bucket in rollup_buckets(game.get("guild_id"), day_key(game["datetime"])):
+            bucket_totals = totals.setdefault(bucket, {'total_games': 0, 'total_score': 0, 'high_score': 0})
+            bucket_totals['total_games'] += 1
+            bucket_totals['total_score'] += game["score"]
+            bucket_totals['high_score'] = max(bucket_totals['high_score'], game["score"])
+
+    # legacy games have no ids to guard on, so each bucket takes its summed history once and is marked
+    requests = []
+    for (guild_id, day), bucket_totals in totals.items():
+        key = rollup_key(guild_id, day, player_id)
+        requests.append(UpdateOne(
+            {'_id': key},
+            {'$setOnInsert': {'guild_id': guild_id, 'day': day, 'player_id': player_id, 'recent_games': []}},
+            upsert=True
+        ))
+        requests.append(UpdateOne(
+            {'_id': key, 'legacy': {'$ne': True}},
+            {
+                '$inc': {'total_games': bucket_totals['total_games'], 'total_score': bucket_totals['total_score']},
+                '$max': {'high_score': bucket_totals['high_score']},
+                '$set': {'legacy': True}
+            }
+        ))
+    return requests
+
+def migrate_player(player):
+    history = player.get("games") or []
+    scores = [game["score"] for game in history]
+
+    if history:
+        # keyed on player and datetime so a re-run after a crash doesn't duplicate history
+        games.bulk_write([
+            UpdateOne(
+                {'player_id': player["_id"], 'datetime': game["datetime"]},
+                {'$setOnInsert': {'guild_id': game.get("guild_id"), 'score': game["score"]}},
+                upsert=True
+            )
+            for game in history
+        ], ordered=False)
+        rollups.bulk_write(rollup_requests(player["_id"], history), ordered=True)
+
+    totals = {
+        'total_games': len(scores),
+        'total_score': sum(scores),
+        'high_score': max(scores, default=0)
+    }
+    if history:
+        totals['last_played'] = max(game["datetime"] for game in history)
+
+    players.update_one({'_id': player["_id"]}, {'$set': totals, '$unset': {'games': ""}})
+
+def backfill_rollups():
+    # players migrated before rollups existed only have their history in games; copied games
+    # carry no coins field, which keeps games the live write path already rolled up out
+    history = []
+    player_id = None
+    backfilled = 0
+    for game in games.find({'coins': {'$exists': False}}).sort('player_id', 1):
+        if game["player_id"] != player_id and history:
+            rollups.bulk_write(rollup_requests(player_id, history), ordered=True)
+            backfilled += 1
+            history = []
+        player_id = game["player_id"]
+        history.append(game)
+    if history:
+        rollups.bulk_write(rollup_requests(player_id, history), ordered=True)
+        backfilled += 1
+    return backfilled
+
+if __name__ == '__main__':
+    if '--rollups' in sys.argv:
+        print(f"Backfilled rollups for {backfill_rollups()} players")
+        sys.exit()
+
+    migrated = 0
+    for player in players.find({'games': {'$exists': True}}):
+        migrate_player(player)
+        migrated += 1
+    print(f"Migrated {migrated} players")
@@ -0,0 +1,49 @@
+import asyncio
+from collections import deque
+
+class CaptchaPool:
+    def __init__(self, renderer, size=50, watermark=20):
+        self.renderer = renderer
+        self.size = size
+        self.watermark = watermark
+        self.captchas = deque()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.refill = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.renderer.start()
+            self.task = asyncio.create_task(self.produce())
+
+    async def produce(self):
+        delay = 1
+        while True:
+            try:
+                while len(self.captchas) < self.size:
+                    self.captchas.extend(await self.renderer.render(self.size - len(self.captchas)))
+            except Exception as e:
+                # keep the producer alive, get() renders on demand until a refill succeeds
+                self.errors += 1
+                print(f"Error refilling captcha pool: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+
+            delay = 1
+            self.refill.clear()
+            await self.refill.wait()
+
+    async def get(self):
+        if self.captchas:
+            self.hits += 1
+            captcha = self.captchas.popleft()
+        else:
+            self.misses += 1
+            captcha = (await self.renderer.render(1))[0]
+
+        if len(self.captchas) <= self.watermark:
+            self.refill.set()
+        return captcha
@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+from discord.ext import commands
+
+class RateLimited(commands.CheckFailure):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class TokenBuckets:
+    def __init__(self, capacity, rate, maxsize=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.maxsize = maxsize
+        self.idle_after = capacity / rate
+        self.buckets = OrderedDict()
+
+    def take(self, key, cost):
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+        retry_after = 0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / self.rate
+
+        self.buckets[key] = (tokens, now)
+        self.evict(now)
+        return retry_after
+
+    def refund(self, key, cost):
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            self.buckets[key] = (min(self.capacity, bucket[0] + cost), bucket[1])
+
+    def evict(self, now):
+        # buckets are kept in last-use order, so the idle ones are at the front;
+        # a bucket untouched for capacity/rate seconds is full again and can be forgotten
+        while self.buckets:
+            key, (tokens, updated) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.maxsize and now - updated < self.idle_after:
+                break
+            del self.buckets[key]
+
+class RateLimiter:
+    def __init__(self, users, guilds, costs, default_cost=1):
+        self.users = users
+        self.guilds = guilds
+        self.costs = costs
+        self.default_cost = default_cost
+        self.limited = 0
+
+    def check(self, command, user_id, guild_id):
+        cost = self.costs.get(command, self.default_cost)
+
+        retry_after = self.users.take(user_id, cost)
+        if not retry_after and guild_id is not None:
+            retry_after = self.guilds.take(guild_id, cost)
+            if retry_after:
+                self.users.refund(user_id, cost)
+
+        if retry_after:
+            self.limited += 1
+            raise RateLimited(retry_after)
+        return True
@@ -0,0 +1,55 @@
+import asyncio
+from captchas import captcha, random_answer, render_captcha
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from metrics import captcha_render_seconds
+
+def init_worker():
+    captcha.glyphs
+
+def render_batch(answers):
+    return [render_captcha(answer) for answer in answers]
+
+class Renderer:
+    def __init__(self, workers=0, batch_size=10):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.executor = None
+
+    def start(self):
+        if self.workers > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def restart(self, executor):
+        # a worker that dies breaks the whole pool and every later submit fails,
+        # so replace it unless a concurrent render already has
+        if self.executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+            self.start()
+
+    async def render(self, count):
+        executor = self.executor
+        try:
+            return await self.render_with(executor, count)
+        except BrokenProcessPool:
+            print("Captcha render workers died, restarting them")
+            self.restart(executor)
+            return await self.render_with(self.executor, count)
+
+    async def render_with(self, executor, count):
+        loop = asyncio.get_running_loop()
+        batches = [[random_answer() for _ in range(min(self.batch_size, count - i))] for i in range(0, count, self.batch_size)]
+
+        with captcha_render_seconds.time():
+            if executor is None:
+                results = [await loop.run_in_executor(None, render_batch, answers) for answers in batches]
+            else:
+                results = await asyncio.gather(*[loop.run_in_executor(executor, render_batch, answers) for answers in batches])
+
+        return [captcha for answers, images in zip(batches, results) for captcha in zip(answers, images)]
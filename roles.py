@@ -0,0 +1,87 @@
+import asyncio
+import discord
+from members import MemberCache
+from metrics import discord_request_seconds
+
+class RoleAwards:
+    def __init__(self, buckets, maxsize=10000, ttl=600):
+        self.buckets = buckets
+        self.guild = None
+        self.thresholds = {}
+        self.held = MemberCache(maxsize, ttl)
+        self.pending = {}
+        self.wake = asyncio.Event()
+        self.task = None
+        self.awarded = 0
+
+    def configure(self, guild, thresholds):
+        self.guild = guild
+        self.thresholds = {role: threshold for role, threshold in thresholds.items() if role is not None}
+        for member in guild.members:
+            self.remember(member)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def remember(self, member):
+        # only the award roles matter, the rest of the member is re-read when an edit is due
+        self.held.set(member.id, frozenset(role.id for role in member.roles if role in self.thresholds))
+
+    def missing(self, held, score):
+        return [role for role, threshold in self.thresholds.items() if score >= threshold and role.id not in held]
+
+    def queue(self, player_id, score, channel):
+        held = self.held.get(player_id)
+        if held is not None and not self.missing(held, score):
+            return
+
+        # a player's later games collapse into one evaluation of their best score
+        previous = self.pending.get(player_id)
+        if previous is None or score > previous[0]:
+            self.pending[player_id] = (score, channel)
+        self.wake.set()
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.pending:
+                player_id = next(iter(self.pending))
+                score, channel = self.pending.pop(player_id)
+                try:
+                    await self.award(player_id, score, channel)
+                except Exception as e:
+                    print(f"Failed to award roles to {player_id}: {e}")
+
+    async def acquire(self, route):
+        while retry_after := self.buckets.take(route, 1):
+            await asyncio.sleep(retry_after)
+
+    async def award(self, player_id, score, channel):
+        member = self.guild.get_member(player_id)
+        if member is None:
+            await self.acquire('fetch_member')
+            with discord_request_seconds.labels('fetch_member').time():
+                member = await self.guild.fetch_member(player_id)
+        self.remember(member)
+
+        new_roles = self.missing(self.held.get(player_id), score)
+        if not new_roles:
+            return
+
+        await self.acquire('edit_member')
+        with discord_request_seconds.labels('edit_member').time():
+            await member.edit(roles=[role for role in member.roles if not role.is_default()] + new_roles)
+        self.held.set(player_id, self.held.get(player_id) | {role.id for role in new_roles})
+        self.awarded += len(new_roles)
+
+        earned = "\n".join(f"**{role.name}** for scoring more than {self.thresholds[role]}" for role in new_roles)
+        embed = discord.Embed(
+            title="New Title Achieved" if len(new_roles) == 1 else "New Titles Achieved",
+            description=f"Congratulations!\nYou earned:\n{earned}\n\n<@{player_id}>",
+            color=discord.Color.purple()
+        )
+        embed.set_thumbnail(url=member.display_avatar.url)
+        with discord_request_seconds.labels('send').time():
+            await channel.send(embed=embed)
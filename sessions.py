@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import time
+
+STARTING = 'starting'
+AWAITING = 'awaiting'
+SOLVED = 'solved'
+EXPIRED = 'expired'
+LOST = 'lost'
+
+transitions = {
+    STARTING: (AWAITING, LOST),
+    AWAITING: (AWAITING, SOLVED, EXPIRED, LOST),
+    SOLVED: (AWAITING,),
+    EXPIRED: (),
+    LOST: ()
+}
+
+class GameSession:
+    __slots__ = ('player_id', 'answer', 'score', 'channel', 'guild_id', 'deadline', 'message_id', 'state')
+
+    def __init__(self, player_id, channel, guild_id=None):
+        self.player_id = player_id
+        self.answer = None
+        self.score = 0
+        self.channel = channel
+        self.guild_id = guild_id
+        self.deadline = None
+        self.message_id = None
+        self.state = STARTING
+
+    def move(self, state):
+        if state not in transitions[self.state]:
+            raise ValueError(f"Game for {self.player_id} cannot go from {self.state} to {state}")
+        self.state = state
+
+    def new_round(self, answer, timeout=10):
+        self.move(AWAITING)
+        self.answer = answer
+        self.deadline = time.time() + timeout
+        self.message_id = None
+
+    def solve(self):
+        self.move(SOLVED)
+        self.score += 1
+
+    def expire(self):
+        self.move(EXPIRED)
+
+    def lose(self):
+        self.move(LOST)
+
+class SessionRegistry:
+    def __init__(self, journal=None, coordinator=None, owner=None, lease_ttl=30):
+        self.sessions = {}
+        self.locks = {}
+        self.channels = {}
+        self.journal = journal
+        self.coordinator = coordinator
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        # the file coordinator blocks on a lock, so leases are taken off the event loop;
+        # one thread keeps a game's release ahead of the player's next claim
+        self.leases = ThreadPoolExecutor(max_workers=1)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, player_id):
+        return self.sessions.get(player_id)
+
+    @asynccontextmanager
+    async def lock(self, player_id):
+        # a player's lock lives while anyone holds or waits on it, so every caller shares the same one
+        entry = self.locks.get(player_id)
+        if entry is None:
+            entry = self.locks[player_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.locks[player_id]
+
+    async def claim(self, player_id):
+        # every cluster has its own registry, the lease keeps a player to one game across all of them
+        if self.coordinator is None:
+            return True
+        return await asyncio.get_running_loop().run_in_executor(self.leases, self.coordinator.acquire, f"player:{player_id}", self.owner, self.lease_ttl)
+
+    async def renew(self, session):
+        if self.sessions.get(session.player_id) is not session:
+            return False
+        await self.claim(session.player_id)
+        return True
+
+    def playing_in(self, channel):
+        return self.channels.get(channel, ())
+
+    def start(self, player_id, channel, guild_id=None):
+        session = GameSession(player_id, channel, guild_id)
+        self.sessions[player_id] = session
+        self.channels.setdefault(channel, set()).add(player_id)
+        return session
+
+    def move(self, session, channel):
+        if session.channel != channel:
+            self.leave_channel(session)
+            session.channel = channel
+            self.channels.setdefault(channel, set()).add(session.player_id)
+
+    def checkpoint(self, session):
+        if self.journal is not None:
+            self.journal.record(session)
+
+    def end(self, session):
+        if self.sessions.get(session.player_id) is session:
+            del self.sessions[session.player_id]
+            self.leave_channel(session)
+
+            self.checkpoint(session)
+            if self.coordinator is not None:
+                asyncio.get_running_loop().run_in_executor(self.leases, self.coordinator.release, f"player:{session.player_id}", self.owner)
+            if self.journal is not None and self.journal.lines > self.journal.max_lines:
+                self.journal.compact(list(self.sessions.values()))
+
+    def leave_channel(self, session):
+        players = self.channels.get(session.channel)
+        if players is not None:
+            players.discard(session.player_id)
+            if not players:
+                del self.channels[session.channel]
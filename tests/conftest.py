@@ -0,0 +1,8 @@
+import pytest
+import database
+from benchmarks.fakemongo import FakeMongo
+
+@pytest.fixture
+def db():
+    database.connect(FakeMongo())
+    return database
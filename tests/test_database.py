@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime
+import pytest
+
+def game(game_id, player_id, score, guild_id=7):
+    return {'_id': game_id, 'player_id': player_id, 'datetime': datetime(2026, 1, 1, 12), 'guild_id': guild_id, 'score': score, 'coins': score * 10}
+
+def test_write_games_credits_players(db):
+    asyncio.run(db.write_games([game('a', 1, 5), game('b', 1, 3), game('c', 2, 4)]))
+
+    player = asyncio.run(db.get_player(1))
+    assert (player['total_games'], player['total_score'], player['high_score'], player['coins']) == (2, 8, 5, 80)
+    assert asyncio.run(db.get_games_count()) == 12
+
+def test_write_games_retry_is_idempotent(db):
+    records = [game('a', 1, 5), game('b', 2, 3)]
+    asyncio.run(db.write_games(records))
+    asyncio.run(db.write_games(records))
+
+    assert asyncio.run(db.get_player(1))['total_score'] == 5
+    assert asyncio.run(db.get_games_count()) == 8
+    assert asyncio.run(db.get_window_top('total_score', 10, 7)) == [(1, 5), (2, 3)]
+
+@pytest.mark.parametrize('failing', ['rollups', 'counters', 'games'])
+def test_write_games_retry_after_partial_failure(db, failing):
+    records = [game('a', 1, 5), game('b', 2, 3)]
+    collection = getattr(db, failing)
+    bulk_write = collection.bulk_write
+
+    async def fail_after_write(*args, **kwargs):
+        await bulk_write(*args, **kwargs)
+        raise RuntimeError("connection reset")
+
+    collection.bulk_write = fail_after_write
+    with pytest.raises(RuntimeError):
+        asyncio.run(db.write_games(records))
+    collection.bulk_write = bulk_write
+    asyncio.run(db.write_games(records))
+
+    assert asyncio.run(db.get_player(1))['total_games'] == 1
+    assert asyncio.run(db.get_games_count()) == 8
+    assert asyncio.run(db.get_window_top('total_games', 10, 7)) == [(1, 1), (2, 1)]
+
+def test_get_rank(db):
+    asyncio.run(db.write_games([game('a', 1, 5), game('b', 2, 9), game('c', 3, 5)]))
+
+    assert asyncio.run(db.get_rank('high_score', 9)) == 1
+    assert asyncio.run(db.get_rank('high_score', 5)) == 2
+    assert asyncio.run(db.get_rank('high_score', None)) is None
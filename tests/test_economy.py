@@ -0,0 +1,40 @@
+import asyncio
+import economy
+
+def seed(db, coins=0, skips=0):
+    asyncio.run(db.players.update_one({'_id': 1}, {'$set': {'coins': coins, 'skips': skips}}, upsert=True))
+
+def test_buy_skips_takes_coins(db):
+    seed(db, coins=2500)
+
+    player = asyncio.run(economy.buy_skips(1, 2))
+    assert (player['coins'], player['skips']) == (500, 2)
+
+def test_buy_skips_refuses_overdraw(db):
+    seed(db, coins=500)
+
+    assert asyncio.run(economy.buy_skips(1, 1)) is None
+    assert asyncio.run(db.get_player(1))['coins'] == 500
+
+def test_parallel_buys_never_overdraw(db):
+    seed(db, coins=5000)
+
+    async def buy_all():
+        return await asyncio.gather(*[economy.buy_skips(1, 1) for _ in range(20)])
+
+    bought = [player for player in asyncio.run(buy_all()) if player is not None]
+    player = asyncio.run(db.get_player(1))
+    assert len(bought) == 5
+    assert (player['coins'], player['skips']) == (0, 5)
+
+def test_use_skip_stops_at_zero(db):
+    seed(db, skips=1)
+
+    assert asyncio.run(economy.use_skip(1))['skips'] == 0
+    assert asyncio.run(economy.use_skip(1)) is None
+
+def test_reward_vote_needs_a_player(db):
+    assert asyncio.run(economy.reward_vote(1, 10)) is None
+
+    seed(db, skips=2)
+    assert asyncio.run(economy.reward_vote(1, 10))['skips'] == 12
@@ -1,4 +1,56 @@
+import asyncio
+import heapq
+import itertools
 import time
 
 def get_countdown():
     return int(time.time())+11
+
+class RoundTimer:
+    def __init__(self):
+        self.heap = []
+        self.rounds = {}
+        self.counter = itertools.count()
+        self.wake = asyncio.Event()
+        self.callbacks = set()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def schedule(self, key, delay, callback, *args):
+        self.cancel(key)
+        entry = [time.monotonic() + delay, next(self.counter), key, callback, args]
+        self.rounds[key] = entry
+        heapq.heappush(self.heap, entry)
+        if self.heap[0] is entry:
+            self.wake.set()
+
+    def cancel(self, key):
+        # cancelled entries stay in the heap until they reach the top, at most one round length later
+        entry = self.rounds.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    async def run(self):
+        while True:
+            while self.heap and self.heap[0][3] is None:
+                heapq.heappop(self.heap)
+
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, key, callback, args = heapq.heappop(self.heap)
+                if callback is None:
+                    continue
+                del self.rounds[key]
+                task = asyncio.create_task(callback(*args))
+                self.callbacks.add(task)
+                task.add_done_callback(self.callbacks.discard)
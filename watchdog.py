@@ -0,0 +1,53 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from metrics import loop_lag_seconds
+
+class LoopWatchdog:
+    def __init__(self, threshold=0.25, interval=0.1, samples=600):
+        self.threshold = threshold
+        self.interval = interval
+        self.lags = deque(maxlen=samples)
+        self.heartbeat = time.monotonic()
+        self.reported = False
+        self.loop_thread_id = None
+        self.task = None
+
+    def start(self):
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self.task = asyncio.create_task(self.beat())
+        threading.Thread(target=self.watch, name="loop-watchdog", daemon=True).start()
+
+    async def beat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0, now - start - self.interval)
+            self.lags.append(lag)
+            loop_lag_seconds.observe(lag)
+            self.heartbeat = now
+            self.reported = False
+
+    def watch(self):
+        # runs in its own thread so it can look at the loop while the loop is stuck
+        while True:
+            time.sleep(self.interval)
+            stalled = time.monotonic() - self.heartbeat - self.interval
+            if stalled > self.threshold and not self.reported:
+                self.reported = True
+                frame = sys._current_frames().get(self.loop_thread_id)
+                stack = "".join(traceback.format_stack(frame)) if frame else ""
+                print(f"Event loop blocked for {stalled:.3f}s, currently running:\n{stack}")
+
+    def percentiles(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return 0, 0
+        return lags[len(lags) // 2], lags[min(len(lags) - 1, int(len(lags) * 0.99))]
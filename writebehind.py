@@ -0,0 +1,70 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+
+class GameWriter:
+    def __init__(self, write, spool_path, batch_size=100, interval=5):
+        self.write = write
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.wake = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.load()
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self.flush()
+
+    def load(self):
+        if not os.path.exists(self.spool_path):
+            return
+        with open(self.spool_path) as spool:
+            for line in spool:
+                record = json.loads(line)
+                record['datetime'] = datetime.fromisoformat(record['datetime'])
+                self.pending.append(record)
+
+    def save(self):
+        with open(self.spool_path, 'w') as spool:
+            for record in self.pending:
+                spool.write(json.dumps({**record, 'datetime': record['datetime'].isoformat()}) + "\n")
+
+    def add(self, record):
+        self.pending.append(record)
+        with open(self.spool_path, 'a') as spool:
+            spool.write(json.dumps({**record, 'datetime': record['datetime'].isoformat()}) + "\n")
+
+        if len(self.pending) >= self.batch_size:
+            self.wake.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            while self.pending:
+                batch = self.pending[:self.batch_size]
+                try:
+                    await self.write(batch)
+                except Exception as e:
+                    # keep the batch spooled, the next flush retries it with the same game ids
+                    print(f"Error writing {len(batch)} games: {e}")
+                    return
+                del self.pending[:len(batch)]
+                self.save()